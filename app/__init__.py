@@ -28,9 +28,16 @@ def create_app():
     iot_app.register_blueprint(frontend_bp)
     iot_app.register_blueprint(error_bp)
 
+    # Register maintenance CLI commands (flask <command>)
+    from .commands import register_commands
+    register_commands(iot_app)
+
     # Automatically create tables if they don't exist
     with iot_app.app_context():
         from app import models  # This ensures all models are loaded
         db.create_all()
+        # create_all skips existing tables; add columns and indexes introduced since they were created
+        from .schema import upgrade_schema
+        upgrade_schema()
     
     return iot_app
@@ -0,0 +1,190 @@
+"""Windowed statistics over the typed store.
+
+count/min/max/mean/stddev per (device, parameter, bucket) are computed in
+SQL from count, sum and sum of squares, which every backend supports.
+Percentiles have no portable SQL form, so when they are requested the raw
+values are fetched once and everything is computed with vectorized NumPy.
+Archived readings are folded in with NumPy as well.
+"""
+import math
+import numpy as np
+from datetime import timedelta
+from sqlalchemy import func, cast, Integer, literal, text
+from . import db
+from .models import SensorValue
+from .timeseries import get_param_ids, param_name, numeric_items
+from .archive import read_archive
+from .rollups import EPOCH
+
+# Upper bound on buckets per series, so a tiny bucket over a long range cannot blow up a request
+MAX_BUCKETS = 10000
+
+
+def _bucket_expression(bucket_seconds):
+    """SQL expression for the integer bucket index of SensorValue.timestamp (0 for a single bucket)."""
+    if not bucket_seconds:
+        return literal(0)
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        # TIMESTAMPDIFF ignores the session time zone, unlike UNIX_TIMESTAMP
+        seconds = func.timestampdiff(text('SECOND'), '1970-01-01 00:00:00', SensorValue.timestamp)
+    elif dialect == 'sqlite':
+        seconds = cast(func.strftime('%s', SensorValue.timestamp), Integer)
+    else:
+        seconds = cast(func.floor(func.extract('epoch', SensorValue.timestamp)), Integer)
+    return seconds // bucket_seconds
+
+
+def _hot_filter(query, device_ids, param_ids, start, end):
+    query = query.filter(SensorValue.device_id.in_(device_ids), SensorValue.param_id.in_(param_ids))
+    if start is not None:
+        query = query.filter(SensorValue.timestamp >= start)
+    if end is not None:
+        query = query.filter(SensorValue.timestamp < end)
+    return query
+
+
+def _archived_values(device_ids, params, start, end, bucket_seconds):
+    """Yield (device_id, param, bucket, value) for archived readings in [start, end).
+
+    The archive is always consulted: archive-sensor-data --days can move rows
+    regardless of RETENTION_DAYS, and read_archive only opens months in range.
+    """
+    for device_id in device_ids:
+        for row in read_archive(device_id, start, end):
+            if end is not None and row['time'] >= end:
+                continue
+            bucket = int((row['time'] - EPOCH).total_seconds() // bucket_seconds) if bucket_seconds else 0
+            for param, value in numeric_items(row['data']):
+                if param in params:
+                    yield device_id, param, bucket, value
+
+
+def _accumulators_from_sql(device_ids, param_ids, start, end, bucket_seconds):
+    bucket = _bucket_expression(bucket_seconds).label('bucket')
+    query = _hot_filter(
+        db.session.query(
+            SensorValue.device_id, SensorValue.param_id, bucket,
+            func.count(SensorValue.value), func.sum(SensorValue.value),
+            func.sum(SensorValue.value * SensorValue.value),
+            func.min(SensorValue.value), func.max(SensorValue.value)
+        ),
+        device_ids, param_ids, start, end
+    ).group_by(SensorValue.device_id, SensorValue.param_id, bucket)
+    return {
+        (device_id, param_name(param_id), int(bucket_index)): [int(count), float(total), float(squares), float(low), float(high)]
+        for device_id, param_id, bucket_index, count, total, squares, low, high in query
+    }
+
+
+def _group(keys, values):
+    """Sort values by (group, value); return (order, group keys, starts, counts) for vectorized reductions."""
+    codes, group_index = np.unique(keys, return_inverse=True, axis=0)
+    group_index = group_index.reshape(-1)
+    order = np.lexsort((values, group_index))
+    _, starts, counts = np.unique(group_index[order], return_index=True, return_counts=True)
+    return order, codes, starts, counts
+
+
+def _accumulators_from_values(rows, percentiles):
+    """Compute accumulators (and percentiles) for (device_id, param, bucket, value) rows with NumPy."""
+    if not rows:
+        return {}, {}
+    devices = sorted({row[0] for row in rows})
+    params = sorted({row[1] for row in rows})
+    device_index = {device_id: i for i, device_id in enumerate(devices)}
+    param_index = {param: i for i, param in enumerate(params)}
+    keys = np.array([(device_index[row[0]], param_index[row[1]], row[2]) for row in rows], dtype=np.int64)
+    values = np.array([row[3] for row in rows], dtype=np.float64)
+
+    order, codes, starts, counts = _group(keys, values)
+    ordered = values[order]
+    sums = np.add.reduceat(ordered, starts)
+    squares = np.add.reduceat(ordered * ordered, starts)
+    lows = ordered[starts]  # Sorted by value within each group
+    highs = ordered[starts + counts - 1]
+
+    quantiles = {}
+    for q in percentiles:
+        # Linear interpolation between closest ranks, as numpy.percentile does by default
+        position = starts + (counts - 1) * (q / 100.0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, starts + counts - 1)
+        quantiles[q] = ordered[below] + (ordered[above] - ordered[below]) * (position - below)
+
+    accumulators = {}
+    extra = {}
+    for i, (device_i, param_i, bucket_index) in enumerate(codes):
+        key = (devices[device_i], params[param_i], int(bucket_index))
+        accumulators[key] = [int(counts[i]), float(sums[i]), float(squares[i]), float(lows[i]), float(highs[i])]
+        extra[key] = {f"p{q:g}": float(quantiles[q][i]) for q in percentiles}
+    return accumulators, extra
+
+
+def _merge(target, source):
+    for key, (count, total, squares, low, high) in source.items():
+        current = target.get(key)
+        if current is None:
+            target[key] = [count, total, squares, low, high]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] += squares
+            current[3] = min(current[3], low)
+            current[4] = max(current[4], high)
+
+
+def _stats(accumulator, time):
+    count, total, squares, low, high = accumulator
+    mean = total / count
+    return {
+        'time': time,
+        'count': int(count),
+        'min': low,
+        'max': high,
+        'mean': mean,
+        # max() guards against tiny negative variances from floating-point cancellation
+        'stddev': math.sqrt(max(squares / count - mean * mean, 0.0)),
+    }
+
+
+def window_stats(device_ids, params, start=None, end=None, bucket_seconds=None, percentiles=()):
+    """Return {device_id: {param: [bucket stats]}} over [start, end).
+
+    Each bucket is {'time', 'count', 'min', 'max', 'mean', 'stddev'} plus
+    'p<q>' for each requested percentile. Without ``bucket_seconds`` the
+    whole window is a single bucket stamped with ``start``. Stddev is the
+    population standard deviation. Raises ValueError for more than
+    MAX_BUCKETS buckets.
+    """
+    device_ids = sorted(set(device_ids))
+    params = set(params)
+    if bucket_seconds and start is not None and end is not None:
+        if (end - start).total_seconds() / bucket_seconds > MAX_BUCKETS:
+            raise ValueError(f'Too many buckets (max {MAX_BUCKETS}); use a larger bucket')
+    param_ids = get_param_ids(params, create=False)
+
+    extra = {}
+    if percentiles:
+        rows = []
+        if param_ids:
+            bucket = _bucket_expression(bucket_seconds).label('bucket')
+            query = _hot_filter(
+                db.session.query(SensorValue.device_id, SensorValue.param_id, bucket, SensorValue.value),
+                device_ids, param_ids.values(), start, end
+            )
+            rows = [(device_id, param_name(param_id), int(bucket_index), value) for device_id, param_id, bucket_index, value in query]
+        rows.extend(_archived_values(device_ids, params, start, end, bucket_seconds))
+        accumulators, extra = _accumulators_from_values(rows, percentiles)
+    else:
+        accumulators = _accumulators_from_sql(device_ids, param_ids.values(), start, end, bucket_seconds) if param_ids else {}
+        _merge(accumulators, _accumulators_from_values(list(_archived_values(device_ids, params, start, end, bucket_seconds)), ())[0])
+
+    result = {device_id: {} for device_id in device_ids}
+    for key in sorted(accumulators):
+        device_id, param, bucket_index = key
+        item = _stats(accumulators[key], EPOCH + timedelta(seconds=bucket_index * bucket_seconds) if bucket_seconds else start)
+        item.update(extra.get(key, {}))
+        result[device_id].setdefault(param, []).append(item)
+    return result
+
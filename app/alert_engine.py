@@ -0,0 +1,303 @@
+import operator
+import threading
+import time
+from collections import namedtuple, defaultdict
+from flask import current_app
+import redis
+from .models import Alert, Notification
+
+# Alert.message is stored as "<parameter> <gate> <value>", e.g. "batper Greater 90"
+OPERATORS = {
+    'Greater': operator.gt,
+    'Less': operator.lt,
+    'Equal': operator.eq,
+}
+
+AlertRule = namedtuple('AlertRule', ['alert_id', 'device_id', 'name', 'param', 'gate', 'threshold', 'compare', 'message'])
+
+_engine_lock = threading.Lock()
+
+
+def compile_alert(alert):
+    """Parse an Alert row into an AlertRule, or None if its message is malformed."""
+    parts = (alert.message or '').split()
+    if len(parts) < 3:
+        return None
+    param, gate, threshold_str = parts[0], parts[1], parts[-1]
+    compare = OPERATORS.get(gate)
+    if compare is None:
+        return None
+    try:
+        threshold = float(threshold_str)
+    except ValueError:
+        return None
+    return AlertRule(alert.id, alert.device_id, alert.alert_type, param, gate, threshold, compare, alert.message)
+
+
+ENTER = 'enter'
+RENOTIFY = 'renotify'
+
+
+class MemoryAlertState:
+    """Per-process alarm state: alert_id -> time of the last notification."""
+
+    def __init__(self):
+        self._notified = {}
+        self._lock = threading.Lock()
+
+    def load(self, alert_ids, cooldown):
+        """Return {alert_id: (in alarm, reminder due)}."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                alert_id: (alert_id in self._notified, now - self._notified.get(alert_id, now) >= cooldown > 0)
+                for alert_id in alert_ids
+            }
+
+    def claim(self, claims, cooldown):
+        """Record (alert_id, ENTER|RENOTIFY) transitions that are still valid; return the granted ones."""
+        now = time.monotonic()
+        granted = []
+        with self._lock:
+            for alert_id, kind in claims:
+                if kind == ENTER and alert_id in self._notified:
+                    continue
+                if kind == RENOTIFY and now - self._notified.get(alert_id, now) < cooldown:
+                    continue
+                self._notified[alert_id] = now
+                granted.append((alert_id, kind))
+        return granted
+
+    def release(self, claims):
+        """Undo granted claims whose notifications were not stored."""
+        with self._lock:
+            for alert_id, kind in claims:
+                if kind == ENTER:
+                    self._notified.pop(alert_id, None)
+                elif alert_id in self._notified:
+                    self._notified[alert_id] = float('-inf')  # Reminder due again
+
+    def clear(self, *alert_ids):
+        with self._lock:
+            for alert_id in alert_ids:
+                self._notified.pop(alert_id, None)
+
+
+class RedisAlertState:
+    """Alarm state shared by every web and RQ worker.
+
+    SET NX makes the transition into alarm fire exactly once across processes;
+    the cooldown key expires on its own to allow the next reminder. Each
+    operation is one pipelined round trip for the whole batch.
+    """
+
+    def __init__(self, redis_url, prefix='farmiot:alert-state'):
+        self._redis = redis.from_url(redis_url)
+        self._prefix = prefix
+
+    def _keys(self, alert_id):
+        return f"{self._prefix}:{alert_id}:active", f"{self._prefix}:{alert_id}:cooldown"
+
+    def load(self, alert_ids, cooldown):
+        alert_ids = list(alert_ids)
+        pipe = self._redis.pipeline(transaction=False)
+        for alert_id in alert_ids:
+            for key in self._keys(alert_id):
+                pipe.exists(key)
+        results = pipe.execute()
+        return {
+            alert_id: (bool(results[2 * i]), bool(cooldown) and not results[2 * i + 1])
+            for i, alert_id in enumerate(alert_ids)
+        }
+
+    def claim(self, claims, cooldown):
+        pipe = self._redis.pipeline(transaction=False)
+        for alert_id, kind in claims:
+            active_key, cooldown_key = self._keys(alert_id)
+            if kind == ENTER:
+                pipe.set(active_key, 1, nx=True)
+            else:
+                pipe.set(cooldown_key, 1, nx=True, ex=int(cooldown))
+        if cooldown:
+            # Entering alarm starts the reminder cooldown
+            for alert_id, kind in claims:
+                if kind == ENTER:
+                    pipe.set(self._keys(alert_id)[1], 1, ex=int(cooldown))
+        results = pipe.execute()
+        return [claim for claim, ok in zip(claims, results) if ok]
+
+    def release(self, claims):
+        keys = []
+        for alert_id, kind in claims:
+            active_key, cooldown_key = self._keys(alert_id)
+            keys.extend([active_key, cooldown_key] if kind == ENTER else [cooldown_key])
+        if keys:
+            self._redis.delete(*keys)
+
+    def clear(self, *alert_ids):
+        keys = [key for alert_id in alert_ids for key in self._keys(alert_id)]
+        if keys:
+            self._redis.delete(*keys)
+
+
+class AlertEvaluation:
+    """Notifications for a batch plus the alarm-state changes behind them.
+
+    Transitions into alarm (and reminders) are claimed before the caller
+    commits, so concurrent workers notify once; recoveries are applied by
+    AlertEngine.commit after the commit succeeds. If it fails,
+    AlertEngine.rollback releases the claims so the alert is not left
+    silently in alarm without a stored notification.
+    """
+
+    def __init__(self):
+        self.notifications = []
+        self.claimed = []
+        self.recovered = []
+
+
+class AlertEngine:
+    """Per-device cache of compiled alert rules, indexed by parameter name.
+
+    Evaluation is edge-triggered: a rule notifies when a reading moves it into
+    alarm, optionally again every ``renotify_seconds`` while it stays there,
+    and re-arms once a reading no longer meets the condition.
+    """
+
+    def __init__(self, ttl=60, state=None, renotify_seconds=0):
+        self.ttl = ttl
+        self.state = state if state is not None else MemoryAlertState()
+        self.renotify_seconds = renotify_seconds
+        self._rules = {}
+        self._lock = threading.Lock()
+
+    def rules_for(self, device_ids):
+        """Return {device_id: {param: [AlertRule]}}, loading cache misses in one query."""
+        now = time.monotonic()
+        found = {}
+        missing = set()
+        with self._lock:
+            for device_id in device_ids:
+                entry = self._rules.get(device_id)
+                if entry is None or entry[0] <= now:
+                    missing.add(device_id)
+                else:
+                    found[device_id] = entry[1]
+
+        if missing:
+            loaded = {device_id: defaultdict(list) for device_id in missing}
+            for alert in Alert.query.filter(Alert.device_id.in_(missing)):
+                rule = compile_alert(alert)
+                if rule is not None:
+                    loaded[alert.device_id][rule.param].append(rule)
+            with self._lock:
+                for device_id, by_param in loaded.items():
+                    by_param = dict(by_param)
+                    self._rules[device_id] = (now + self.ttl, by_param)
+                    found[device_id] = by_param
+        return found
+
+    def evaluate(self, readings, timestamp, rules_by_device):
+        """Evaluate (device_id, data) readings, in time order, against their devices' rules.
+
+        Returns an AlertEvaluation; the caller stores its notifications and
+        then calls commit() or rollback() on this engine.
+        """
+        hits = []
+        for device_id, data in readings:
+            for param, param_rules in (rules_by_device.get(device_id) or {}).items():
+                value = data.get(param)
+                if value is None:
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue  # A non-numeric reading neither triggers nor clears an alarm
+                hits.extend((rule, rule.compare(value, rule.threshold)) for rule in param_rules)
+
+        evaluation = AlertEvaluation()
+        if not hits:
+            return evaluation
+
+        # Current state in one call, then the batch is replayed locally
+        state = self.state.load({rule.alert_id for rule, _ in hits}, self.renotify_seconds)
+        plans = {}
+        pending = []
+        for rule, in_alarm in hits:
+            plan = plans.get(rule.alert_id)
+            if plan is None:
+                active, reminder_due = state[rule.alert_id]
+                plan = plans[rule.alert_id] = {'was_active': active, 'active': active, 'reminder_due': reminder_due, 'claim': None}
+            if not in_alarm:
+                plan['active'] = False  # Recovered; the next crossing notifies again
+                continue
+            if not plan['active']:
+                plan['active'] = True
+                plan['reminder_due'] = False
+                if not plan['was_active']:
+                    plan['claim'] = ENTER
+            elif self.renotify_seconds and plan['reminder_due']:
+                plan['reminder_due'] = False
+                plan['claim'] = plan['claim'] or RENOTIFY
+            else:
+                continue
+            pending.append((rule.alert_id, Notification(
+                alert_id=rule.alert_id,
+                device_id=rule.device_id,
+                alert_name=rule.name,
+                message=rule.message,
+                timestamp=timestamp,
+                seen=False
+            )))
+
+        claims = [(alert_id, plan['claim']) for alert_id, plan in plans.items() if plan['claim'] and plan['active']]
+        evaluation.claimed = self.state.claim(claims, self.renotify_seconds) if claims else []
+        # Another worker got there first for claims that were not granted
+        rejected = set(claims) - set(evaluation.claimed)
+        rejected_ids = {alert_id for alert_id, _ in rejected}
+        evaluation.notifications = [notification for alert_id, notification in pending if alert_id not in rejected_ids]
+        evaluation.recovered = [alert_id for alert_id, plan in plans.items() if plan['was_active'] and not plan['active']]
+        return evaluation
+
+    def commit(self, evaluation):
+        """Apply recoveries once the evaluation's notifications are stored."""
+        if evaluation.recovered:
+            try:
+                self.state.clear(*evaluation.recovered)
+            except redis.RedisError as e:
+                print(f"Alert state update failed: {e}")
+
+    def rollback(self, evaluation):
+        """Release the claims of an evaluation whose notifications were not stored."""
+        if evaluation.claimed:
+            try:
+                self.state.release(evaluation.claimed)
+            except redis.RedisError as e:
+                print(f"Alert state release failed: {e}")
+
+    def invalidate(self, device_id):
+        with self._lock:
+            self._rules.pop(device_id, None)
+
+    def forget(self, alert_id):
+        """Drop the alarm state of a deleted alert."""
+        self.state.clear(alert_id)
+
+
+def get_alert_engine():
+    """Return the app's alert engine, creating it on first use."""
+    app = current_app._get_current_object()
+    with _engine_lock:
+        engine = app.extensions.get('alert_engine')
+        if engine is None:
+            if app.config['ALERT_STATE_BACKEND'] == 'redis':
+                state = RedisAlertState(app.config['RQ_REDIS_URL'])
+            else:
+                state = MemoryAlertState()
+            engine = AlertEngine(
+                ttl=app.config['ALERT_RULE_CACHE_TTL'],
+                state=state,
+                renotify_seconds=app.config['ALERT_RENOTIFY_SECONDS']
+            )
+            app.extensions['alert_engine'] = engine
+    return engine
@@ -1,12 +1,35 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, send_file
 from Crypto.Cipher import AES
 import base64
+import hashlib
+import io
 import json
 from datetime import datetime, timedelta  # Added timedelta import
+from itertools import islice
+from concurrent.futures import TimeoutError as FlushTimeout
 import os
+import queue
 import redis
-from rq import Queue
-from .worker import insert_sensor_data
+from rq import Queue, Retry
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from .worker import insert_sensor_data, ingest_sensor_readings, export_sensor_data
+from .export import available_formats
+from .bulk_import import FORMATS as IMPORT_FORMATS, iter_csv_readings, iter_ndjson_readings, import_readings
+from .ingest import ingest_readings
+from .write_buffer import get_write_buffer
+from .device_registry import get_device_registry
+from .alert_engine import get_alert_engine
+from .frames import parse_frame_payload
+from .live import get_live_hub
+from .timeseries import load_history, iter_history
+from .downsample import downsample_rows, METHODS as DOWNSAMPLE_METHODS
+from .gapfill import fill_gaps, carry_forward, parse_interval, STALE_AFTER
+from .aggregation import window_stats
+from .forecast import forecast, METHODS as FORECAST_METHODS
+from . import columnar
+from .archive import delete_archive
+from .device_state import latest_reading, touch_devices, device_versions, device_summaries
 from .jwt_utils import encode_token
 from .models import User, db
 from flask import session
@@ -17,7 +40,9 @@ from .models import SensorData  # Import SensorData model
 from .models import Chart  # Import Chart model
 from .models import Alert  # Import Alert model
 from .models import Notification  # Import Notification model
+from .models import SensorValue, SensorRollup, DeviceState
 from sqlalchemy import func  
+from werkzeug.http import is_resource_modified
 from sqlalchemy import desc
 
 api_bp = Blueprint('api', __name__)
@@ -30,19 +55,197 @@ AES_KEY = os.getenv("AES_KEY").encode()
 
 def pad(s): return s + (16 - len(s) % 16) * ' '
 
-def ensure_recent_sensor_data(device_id):
-    """Ensure there is a sensor data record for the device within the last 30 minutes.
-    If not, create a demo record using the last available data."""
-    thirty_minutes_ago = datetime.utcnow() - timedelta(minutes=30)
-    last_data = SensorData.query.filter_by(device_id=device_id).order_by(desc(SensorData.timestamp)).first()
-    if last_data and last_data.timestamp < thirty_minutes_ago:
-        demo_data = SensorData(
-            device_id=device_id,
-            timestamp=datetime.utcnow(),
-            data=last_data.data
-        )
-        db.session.add(demo_data)
-        db.session.commit()
+def enqueue_readings(readings):
+    """Hand readings to the RQ workers and answer 202 without touching the database."""
+    job = q.enqueue(
+        ingest_sensor_readings,
+        readings,
+        retry=Retry(max=3, interval=[5, 30, 120]),
+        result_ttl=current_app.config['INGEST_JOB_RESULT_TTL']
+    )
+    return jsonify({'message': 'Sensor data queued', 'job_id': job.id, 'queued': len(readings)}), 202
+
+def store_single_reading(device_id, data, success_message):
+    """Store one reading using the configured ingest mode (async queue, write buffer or direct)."""
+    reading = {'device_id': device_id, 'timestamp': datetime.utcnow().isoformat(), 'data': data}
+
+    # Async mode: device validation, persistence and alerts happen in the RQ worker
+    if current_app.config['INGEST_ASYNC']:
+        try:
+            return enqueue_readings([reading])
+        except Exception as e:
+            return jsonify({'error': 'Failed to queue sensor data', 'details': str(e)}), 503
+
+    try:
+        if current_app.config['WRITE_BUFFER_ENABLED']:
+            # Group commit: block until the batch holding this reading is durable
+            buffer = get_write_buffer()
+            future = buffer.submit(reading)
+            try:
+                result = future.result(current_app.config['WRITE_BUFFER_TIMEOUT'])
+            except FlushTimeout:
+                if buffer.cancel(future):
+                    # Not written and no longer queued: safe for the device to retry
+                    return jsonify({'error': 'Sensor data not stored, retry later'}), 503
+                # Already part of a batch being written; a retry would store it twice
+                return jsonify({'message': 'Sensor data accepted, pending flush'}), 202
+        else:
+            result = ingest_readings([reading])[0]
+        if result['status'] != 'ok':
+            return jsonify({'error': result['error']}), 404 if result['error'] == DEVICE_NOT_FOUND_MSG else 400
+        return jsonify({'message': success_message}), 201
+    except Exception as e:
+        return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
+
+def store_batch(readings):
+    """Store a list of readings (queued in async mode) and report per-item results."""
+    if current_app.config['INGEST_ASYNC']:
+        # Stamp readings now so queueing delay does not shift their time
+        received_at = datetime.utcnow().isoformat()
+        for reading in readings:
+            if isinstance(reading, dict) and not reading.get('timestamp'):
+                reading['timestamp'] = received_at
+        try:
+            return enqueue_readings(readings)
+        except Exception as e:
+            return jsonify({'error': 'Failed to queue sensor data', 'details': str(e)}), 503
+
+    try:
+        results = ingest_readings(readings)
+        stored = sum(1 for result in results if result['status'] == 'ok')
+        return jsonify({
+            'stored': stored,
+            'failed': len(results) - stored,
+            'results': results
+        }), 201 if stored else 400
+    except Exception as e:
+        return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
+
+def fill_history(records, descending=False, end=None, max_points=None):
+    """Gap-fill rows per ?fill=locf|linear|null&interval=5m, read-time only.
+
+    Without fill= a stale latest reading is still carried forward to "now"
+    (when the range reaches now), as the demo dashboards expect. Gaps are
+    only meaningful between raw readings, so fill= cannot be combined with
+    max_points (rollups and downsampling leave gaps of their own). Raises
+    ValueError for bad parameters.
+    """
+    now = datetime.utcnow()
+    method = request.args.get('fill')
+    if method and max_points:
+        raise ValueError('fill cannot be combined with max_points')
+    if method:
+        interval = parse_interval(request.args.get('interval', '5m'))
+        return fill_gaps(records, interval, method, min(end, now) if end else now, descending)
+    if end is None or end >= now:
+        return carry_forward(records, now, descending)
+    return records
+
+def history_item(record):
+    """Serialize a load_history row; rollup buckets also carry per-parameter min/max."""
+    item = {'time': record['time'].isoformat(), 'data': record['data']}
+    if 'min' in record:
+        item['min'] = record['min']
+        item['max'] = record['max']
+    if record.get('synthetic'):
+        item['synthetic'] = True
+    return item
+
+def history_response(records):
+    """Serialize load_history rows as row JSON, columnar JSON (format=columnar) or, via Accept, packed binary/msgpack."""
+    mimetype = request.accept_mimetypes.best_match(columnar.mimetypes(), default=columnar.JSON_MIMETYPE)
+    if mimetype == columnar.PACKED_MIMETYPE:
+        response = Response(columnar.pack_columns(columnar.to_columns(records)), mimetype=mimetype)
+    elif mimetype == columnar.MSGPACK_MIMETYPE:
+        response = Response(columnar.pack_msgpack(columnar.to_columns(records)), mimetype=mimetype)
+    elif request.args.get('format') == 'columnar':
+        response = jsonify(columnar.to_columns(records))
+    else:
+        response = jsonify([history_item(record) for record in records])
+    response.vary.add('Accept')
+    return response
+
+def device_validators(*criteria, salt=None):
+    """ETag and Last-Modified for a response that only changes when the matching devices do.
+
+    ``salt`` folds in anything else the response depends on (e.g. a time
+    window); salted responses get no Last-Modified, since it could not
+    express that.
+    """
+    versions = device_versions(*criteria)
+    tag = ','.join(f"{device_id}:{versions[device_id][0]}" for device_id in sorted(versions))
+    etag = hashlib.sha1(f"{tag}|{salt}|{request.headers.get('Accept', '')}".encode()).hexdigest()[:24]
+    changed = [changed_at for _, changed_at in versions.values() if changed_at is not None]
+    last_modified = max(changed) if changed and salt is None else None
+    return etag, last_modified
+
+def not_modified(validators):
+    etag, last_modified = validators
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def with_validators(response, validators):
+    """Attach validators; no-cache makes browsers revalidate every poll instead of reusing stale data."""
+    etag, last_modified = validators
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
+def parse_since(value):
+    """Parse a since= timestamp cursor (the time of the newest reading the client already has)."""
+    return datetime.fromisoformat(value) if value else None
+
+def encode_cursor(record):
+    return base64.urlsafe_b64encode(f"{record['time'].isoformat()}|{record['id']}".encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def history_export(device_id, serialize, descending):
+    """Cursor-paginated (limit/cursor) or streaming NDJSON (format=ndjson) history.
+
+    Returns None when the request asked for neither, so callers keep their
+    classic single-document response.
+    """
+    wants_ndjson = (
+        request.args.get('format') == 'ndjson'
+        or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+    )
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if not wants_ndjson and limit is None and cursor is None:
+        return None
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if wants_ndjson:
+        records = iter_history(device_id, after, descending)
+        if limit is not None:
+            records = islice(records, max(limit, 0))
+
+        def generate():
+            for record in records:
+                yield json.dumps(serialize(record)) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = min(max(limit or 1000, 1), current_app.config['HISTORY_PAGE_MAX'])
+    records = list(islice(iter_history(device_id, after, descending, chunk_size=limit + 1), limit + 1))
+    page = records[:limit]
+    return jsonify({
+        'records': [serialize(record) for record in page],
+        'next_cursor': encode_cursor(page[-1]) if len(records) > limit else None
+    })
 
 @api_bp.route('/login', methods=['POST'])
 def login():
@@ -101,30 +304,26 @@ def get_devices():
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        devices = Device.query.filter_by(user_id=user.id).all()
-        thirty_minutes_ago = datetime.utcnow() - timedelta(minutes=30)
-
-        # Ensure demo record for each device if needed
-        for device in devices:
-            ensure_recent_sensor_data(device.device_id)
+        # is_active depends on the clock too, so the ETag also rolls over every minute
+        validators = device_validators(Device.user_id == user.id, salt=int(datetime.utcnow().timestamp() // 60))
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
 
         device_list = [
             {
-                'device_id': device.device_id,
-                'device_name': device.device_name,
-                'device_type': device.device_type,
-                'device_description': device.device_description,
-                'device_coordinates': device.device_coordinates,
-                'registered_at': device.registered_at.isoformat(),
-                'is_active': SensorData.query.filter(
-                    SensorData.device_id == device.device_id,
-                    SensorData.timestamp >= thirty_minutes_ago  # Updated time window
-                ).count() > 0,
-                'unseen_notifications': Notification.query.filter_by(device_id=device.device_id, seen=False).count()
+                'device_id': summary['device'].device_id,
+                'device_name': summary['device'].device_name,
+                'device_type': summary['device'].device_type,
+                'device_description': summary['device'].device_description,
+                'device_coordinates': summary['device'].device_coordinates,
+                'registered_at': summary['device'].registered_at.isoformat(),
+                'last_seen': summary['last_seen'].isoformat() if summary['last_seen'] else None,
+                'is_active': summary['is_active'],
+                'unseen_notifications': summary['unseen_notifications']
             }
-            for device in devices
+            for summary in device_summaries(user.id)
         ]
-        return jsonify({'devices': device_list})
+        return with_validators(jsonify({'devices': device_list}), validators)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch devices', 'details': str(e)}), 500
 
@@ -177,6 +376,7 @@ def register_device():
         )
         db.session.add(new_device)
         db.session.commit()
+        get_device_registry().invalidate(device_id)  # Drop any cached "unknown device" entry
 
         return jsonify({'message': 'Device registered successfully'}), 201
     except IntegrityError as e:
@@ -197,81 +397,27 @@ def store_sensor_data():
     if not device_id or not data:
         return jsonify({'error': 'Missing device_id or data'}), 400
 
-    try:
-        # Check if the device exists
-        device = Device.query.filter_by(device_id=device_id).first()
-        if not device:
-            return jsonify({'error': DEVICE_NOT_FOUND_MSG}), 404
-        if not device:
-            return jsonify({'error': 'Device not found'}), 404
-
-        # Create a new SensorData record
-        new_sensor_data = SensorData(
-            device_id=device_id,
-            timestamp=datetime.utcnow(),  # Ensure timestamp is stored in UTC
-            data=data
-        )
-        db.session.add(new_sensor_data)
-        db.session.commit()
-
-
-        # After sensor data is saved, check alerts
-        alerts = Alert.query.filter_by(device_id=device_id).all()
-        timestamp_now = datetime.utcnow()
-
-        for alert in alerts:
-            param = alert.message.split()[0]        # e.g. "batper"
-            operator = alert.message.split()[1]     # e.g. "Greater"
-            threshold = float(alert.message.split()[-1])  # e.g. 90
-
-            # Only if param exists in new sensor data
-            value = data.get(param)
-            if value is not None:
-                try:
-                    value = float(value)
-                except ValueError:
-                    continue  # skip non-numeric values
-
-                # Apply logic
-                trigger = False
-                if operator == "Greater" and value > threshold:
-                    trigger = True
-                elif operator == "Less" and value < threshold:
-                    trigger = True
-                elif operator == "Equal" and value == threshold:
-                    trigger = True
-
-                # Create Notification if condition is met
-                if trigger:
-                    new_notification = Notification(
-                        alert_id=alert.id,
-                        device_id=device_id,
-                        alert_name=alert.alert_type,
-                        message=alert.message,
-                        timestamp=timestamp_now,
-                        seen=False
-                    )
-                    db.session.add(new_notification)
-
-        # Commit any notifications created
-        db.session.commit()
-
-
-        return jsonify({'message': 'Sensor data stored successfully'}), 201
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
+    return store_single_reading(device_id, data, 'Sensor data stored successfully')
 
 
 @api_bp.route('/get-all-device-data/<device_id>', methods=['GET'])
+@login_required
 def get_all_device_data(device_id):
     try:
-        # Fetch all sensor data for the device
-        records = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.desc()).all()
+        exported = history_export(
+            device_id,
+            lambda record: {'timestamp': record['time'].isoformat(), 'data': record['data']},
+            descending=True
+        )
+        if exported is not None:
+            return exported
+
+        # Fetch all sensor data for the device, hot and archived
+        records = load_history(device_id, descending=True)
         data_list = [
             {
-                'timestamp': record.timestamp.isoformat(),
-                'data': record.data
+                'timestamp': record['time'].isoformat(),
+                'data': record['data']
             }
             for record in records
         ]
@@ -284,18 +430,19 @@ def get_all_device_data(device_id):
 @login_required
 def get_device_data(device_id):
     try:
-        ensure_recent_sensor_data(device_id)
         # Fetch device information
-        device = Device.query.filter_by(device_id=device_id).first()
+        device = get_device_registry().get(device_id)
         if not device:
             return jsonify({'error': 'Device not found'}), 404
 
-        # Fetch the latest sensor data for the device
-        latest_data = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.desc()).first()
-        data_points = latest_data.data if latest_data else {}
+        validators = device_validators(Device.device_id == device_id)
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
 
-        # Extract parameter names from the data points
-        params = list(data_points.keys()) if isinstance(data_points, dict) else []
+        # Fetch the latest sensor data for the device
+        state = latest_reading(device_id)
+        data_points = state['data'] if state else {}
+        params = state['params'] if state else []
 
         # Prepare the response
         response = {
@@ -307,7 +454,7 @@ def get_device_data(device_id):
             'params': params
         }
 
-        return jsonify(response)
+        return with_validators(jsonify(response), validators)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch device data', 'details': str(e)}), 500
 
@@ -316,17 +463,27 @@ def get_device_data(device_id):
 @login_required
 def get_last_20_device_data(device_id):
     try:
-        ensure_recent_sensor_data(device_id)
-        # Fetch the last 20 sensor data records for the device
-        records = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.desc()).limit(20).all()
-        data_list = [
-            {
-                'time': record.timestamp.isoformat(),
-                'data': record.data
-            }
-            for record in records
-        ]
-        return jsonify(data_list)
+        try:
+            since = parse_since(request.args.get('since'))
+        except ValueError:
+            return jsonify({'error': 'Invalid since timestamp. Use ISO format.'}), 400
+
+        # Gap-filled and carried-forward points move with the clock, so those responses also expire every minute
+        state = latest_reading(device_id)
+        moving = request.args.get('fill') or (state is not None and datetime.utcnow() - state['last_seen'] >= STALE_AFTER)
+        validators = device_validators(Device.device_id == device_id, salt=int(datetime.utcnow().timestamp() // 60) if moving else None)
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
+
+        # Fetch the last 20 sensor data records for the device, only those newer than since= if given
+        records = load_history(device_id, start=since, limit=20, descending=True)
+        if since is not None:
+            records = [record for record in records if record['time'] > since]
+        else:
+            records = fill_history(records, descending=True)[:20]
+        return with_validators(history_response(records), validators)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch device data', 'details': str(e)}), 500
 
@@ -334,7 +491,6 @@ def get_last_20_device_data(device_id):
 @api_bp.route('/device_data_range/<device_id>', methods=['GET'])
 @login_required
 def get_device_data_range(device_id):
-    ensure_recent_sensor_data(device_id)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
@@ -346,25 +502,25 @@ def get_device_data_range(device_id):
         # Parse dates
         start_date = datetime.fromisoformat(start_date)
         end_date = datetime.fromisoformat(end_date)
-
-        # Fetch sensor data within the date range
-        records = SensorData.query.filter(
-            SensorData.device_id == device_id,
-            SensorData.timestamp >= start_date,
-            SensorData.timestamp <= end_date
-        ).order_by(SensorData.timestamp.asc()).all()
-
-        data_list = [
-            {
-                'time': record.timestamp.isoformat(),
-                'data': record.data
-            }
-            for record in records
-        ]
-
-        return jsonify(data_list)
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DD).'}), 400
+
+    try:
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('downsample', 'lttb')
+        if method not in DOWNSAMPLE_METHODS:
+            return jsonify({'error': f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}"}), 400
+
+        # Fetch sensor data within the date range (pre-aggregated rollups when max_points is given)
+        records = load_history(device_id, start=start_date, end=end_date, max_points=max_points)
+        # Carry forward before thinning, so the synthetic point counts against max_points
+        records = fill_history(records, end=end_date, max_points=max_points)
+        # Rollups only get close to max_points; thin raw rows (or a too-fine rollup) down to it
+        records = downsample_rows(records, max_points, method)
+
+        return history_response(records)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch device data', 'details': str(e)}), 500
 
@@ -373,19 +529,262 @@ def get_device_data_range(device_id):
 @login_required
 def get_all_device_data_records(device_id):
     try:
-        ensure_recent_sensor_data(device_id)
-        # Fetch all sensor data records for the device
-        records = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.asc()).all()
-        data_list = [
+        exported = history_export(
+            device_id,
+            lambda record: {'time': record['time'].isoformat(), 'data': record['data']},
+            descending=False
+        )
+        if exported is not None:
+            return exported
+
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('downsample', 'lttb')
+        if method not in DOWNSAMPLE_METHODS:
+            return jsonify({'error': f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}"}), 400
+
+        # Fetch all sensor data records for the device (pre-aggregated rollups when max_points is given)
+        records = load_history(device_id, max_points=max_points)
+        records = fill_history(records, max_points=max_points)
+        records = downsample_rows(records, max_points, method)
+        return history_response(records)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch all device data', 'details': str(e)}), 500
+
+
+@api_bp.route('/aggregate', methods=['GET'])
+@login_required
+def aggregate_device_data():
+    """Per-bucket count/min/max/mean/stddev (and optional percentiles) for devices and parameters.
+
+    Query: device_ids=1,2 params=temperature,humidity start=/end= (ISO, default
+    the last 24 hours) bucket=1h (default one bucket for the whole range)
+    percentiles=50,95.
+    """
+    device_ids = [value for value in request.args.get('device_ids', request.args.get('device_id', '')).split(',') if value]
+    params = [value for value in request.args.get('params', '').split(',') if value]
+    if not device_ids or not params:
+        return jsonify({'error': 'Missing device_ids or params'}), 400
+
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=1)
+        bucket = int(parse_interval(request.args['bucket']).total_seconds()) if request.args.get('bucket') else None
+        percentiles = [float(value) for value in request.args.get('percentiles', '').split(',') if value]
+        if any(not 0 <= q <= 100 for q in percentiles):
+            raise ValueError('Percentiles must be between 0 and 100')
+    except ValueError as e:
+        return jsonify({'error': 'Invalid aggregation parameters', 'details': str(e)}), 400
+
+    try:
+        user = User.query.filter_by(email=session['user_email']).first()
+        devices = get_device_registry().get_many(device_ids)
+        if len(devices) != len(set(device_ids)) or any(device.user_id != user.id for device in devices.values()):
+            return jsonify({'error': 'Device not found'}), 404
+
+        stats = window_stats(device_ids, params, start, end, bucket, percentiles)
+        series = [
             {
-                'time': record.timestamp.isoformat(),
-                'data': record.data
+                'device_id': device_id,
+                'param': param,
+                'buckets': [dict(item, time=item['time'].isoformat()) for item in buckets]
             }
-            for record in records
+            for device_id, by_param in stats.items()
+            for param, buckets in by_param.items()
         ]
-        return jsonify(data_list)
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(), 'bucket': bucket, 'series': series})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': 'Failed to fetch all device data', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to aggregate device data', 'details': str(e)}), 500
+
+
+@api_bp.route('/device_forecast/<device_id>', methods=['GET'])
+@login_required
+def get_device_forecast(device_id):
+    """Next expected values after a device's latest reading, for chart overlays.
+
+    Query: params=temperature,humidity (default: the parameters of the latest
+    reading) method=ewma|linear step=5m steps=48 (history buckets) horizon=1.
+    """
+    params = [value for value in request.args.get('params', '').split(',') if value]
+    method = request.args.get('method', 'ewma')
+    if method not in FORECAST_METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(FORECAST_METHODS)}"}), 400
+    try:
+        step = parse_interval(request.args.get('step', '5m'))
+        steps = int(request.args.get('steps', 48))
+        horizon = int(request.args.get('horizon', 1))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid forecast parameters', 'details': str(e)}), 400
+
+    try:
+        user = User.query.filter_by(email=session['user_email']).first()
+        device = get_device_registry().get(device_id)
+        if device is None or device.user_id != user.id:
+            return jsonify({'error': 'Device not found'}), 404
+
+        state = latest_reading(device_id)
+        if state is None:
+            return jsonify({'device_id': device_id, 'method': method, 'step': int(step.total_seconds()), 'based_on': None, 'forecast': {}})
+        # The window ends just after the latest reading so it is included
+        end = state['last_seen'] + timedelta(microseconds=1)
+        series = forecast({device_id: end}, params or state['params'], method, horizon, step, steps)[device_id]
+        return jsonify({
+            'device_id': device_id,
+            'method': method,
+            'step': int(step.total_seconds()),
+            'based_on': state['last_seen'].isoformat(),
+            'forecast': {
+                param: {
+                    'samples': item['samples'],
+                    'points': [
+                        {'time': (state['last_seen'] + step * h).isoformat(), 'value': value}
+                        for h, value in enumerate(item['values'], start=1)
+                    ]
+                }
+                for param, item in series.items()
+            }
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to forecast device data', 'details': str(e)}), 500
+
+
+@api_bp.route('/exports', methods=['POST'])
+@login_required
+def create_export():
+    req = request.get_json(silent=True) or {}
+    device_ids = req.get('device_ids')
+    fmt = req.get('format', 'csv')
+    params = req.get('params')
+
+    # Validate mandatory fields
+    if not isinstance(device_ids, list) or not device_ids:
+        return jsonify({'error': 'Missing device_ids'}), 400
+    if fmt not in available_formats():
+        return jsonify({'error': f"format must be one of {', '.join(available_formats())}"}), 400
+    if params is not None and not isinstance(params, list):
+        return jsonify({'error': 'params must be a list'}), 400
+    try:
+        start = datetime.fromisoformat(req['start']) if req.get('start') else None
+        end = datetime.fromisoformat(req['end']) if req.get('end') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DD).'}), 400
+
+    try:
+        user = User.query.filter_by(email=session['user_email']).first()
+        device_ids = [str(device_id) for device_id in device_ids]
+        devices = get_device_registry().get_many(device_ids)
+        if len(devices) != len(set(device_ids)) or any(device.user_id != user.id for device in devices.values()):
+            return jsonify({'error': DEVICE_NOT_FOUND_MSG}), 404
+
+        job = q.enqueue(
+            export_sensor_data,
+            sorted(set(device_ids)), start, end, fmt, params,
+            job_timeout=current_app.config['EXPORT_JOB_TIMEOUT'],
+            result_ttl=current_app.config['EXPORT_RESULT_TTL'],
+            failure_ttl=current_app.config['EXPORT_RESULT_TTL'],
+            meta={'user_id': user.id}
+        )
+        return jsonify({
+            'job_id': job.id,
+            'status_url': f"/exports/{job.id}",
+            'download_url': f"/exports/{job.id}/download"
+        }), 202
+    except Exception as e:
+        return jsonify({'error': 'Failed to queue export', 'details': str(e)}), 503
+
+
+def fetch_export_job(job_id):
+    """Return the user's export job, or None if it does not exist (or belongs to someone else)."""
+    try:
+        job = Job.fetch(job_id, connection=r)
+    except NoSuchJobError:
+        return None
+    user = User.query.filter_by(email=session['user_email']).first()
+    if user is None or job.meta.get('user_id') != user.id:
+        return None
+    return job
+
+
+@api_bp.route('/exports/<job_id>', methods=['GET'])
+@login_required
+def export_status(job_id):
+    try:
+        job = fetch_export_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Export not found'}), 404
+
+        status = job.get_status()
+        response = {'job_id': job.id, 'status': str(status.value if hasattr(status, 'value') else status), 'progress': job.meta.get('progress')}
+        if job.is_finished:
+            result = job.result
+            response.update({'rows': result['rows'], 'format': result['format'], 'download_url': f"/exports/{job.id}/download"})
+        elif job.is_failed:
+            response['error'] = 'Export failed'
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch export status', 'details': str(e)}), 500
+
+
+@api_bp.route('/exports/<job_id>/download', methods=['GET'])
+@login_required
+def download_export(job_id):
+    try:
+        job = fetch_export_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Export not found'}), 404
+        if not job.is_finished:
+            return jsonify({'error': 'Export is not ready'}), 409
+
+        result = job.result
+        if not os.path.exists(result['path']):
+            return jsonify({'error': 'Export file has expired'}), 410
+        mimetype = 'text/csv' if result['format'] == 'csv' else 'application/vnd.apache.parquet'
+        return send_file(result['path'], mimetype=mimetype, as_attachment=True, download_name=f"farmiot-export-{job.id}.{result['format']}")
+    except Exception as e:
+        return jsonify({'error': 'Failed to download export', 'details': str(e)}), 500
+
+
+@api_bp.route('/import', methods=['POST'])
+@login_required
+def import_device_data():
+    """Import a CSV/NDJSON file of historical readings for the user's devices.
+
+    The file is a multipart ``file`` field or the raw body; format= (csv or
+    ndjson) defaults from the file name. alerts=1 evaluates alert rules and
+    keep_duplicates=1 disables duplicate detection.
+    """
+    upload = request.files.get('file')
+    filename = upload.filename if upload is not None else ''
+    fmt = request.args.get('format') or ('ndjson' if filename.endswith(('.ndjson', '.jsonl')) or request.mimetype == 'application/x-ndjson' else 'csv')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+
+    try:
+        user = User.query.filter_by(email=session['user_email']).first()
+        owned = {device_id for (device_id,) in db.session.query(Device.device_id).filter_by(user_id=user.id)}
+
+        # Parse straight off the request stream instead of loading the file into memory
+        stream = io.TextIOWrapper(upload.stream if upload is not None else request.stream, encoding='utf-8', newline='')
+        lines = iter_csv_readings(stream) if fmt == 'csv' else iter_ndjson_readings(stream)
+        report = import_readings(
+            lines,
+            batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+            check_alerts=request.args.get('alerts') == '1',
+            skip_duplicates=request.args.get('keep_duplicates') != '1',
+            allowed_device_ids=owned
+        )
+        return jsonify(report), 201 if report['imported'] else 200
+    except (ValueError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({'error': 'Invalid import file', 'details': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Import failed', 'details': str(e)}), 500
 
 
 @api_bp.route('/data', methods=['GET'])
@@ -397,74 +796,85 @@ def device_webhook():
     if not device_id or not data:
         return jsonify({'error': 'Missing device_id or data'}), 400
 
+    return store_single_reading(device_id, data, 'Demo data pushed successfully')
+
+
+@api_bp.route('/data/batch', methods=['POST'])
+def device_webhook_batch():
+    req = request.get_json(silent=True)
+    readings = req.get('readings') if isinstance(req, dict) else req
+
+    # Validate the envelope; individual readings are validated per item
+    if not isinstance(readings, list) or not readings:
+        return jsonify({'error': 'Missing readings'}), 400
+    if len(readings) > current_app.config['INGEST_BATCH_MAX']:
+        return jsonify({'error': f"Too many readings (max {current_app.config['INGEST_BATCH_MAX']})"}), 413
+
+    return store_batch(readings)
+
+
+@api_bp.route('/data/frames', methods=['POST'])
+def device_frames():
+    # Binary AES-GCM frames (see app/frames.py); text bodies are treated as base64
+    is_base64 = request.args.get('encoding') == 'base64' or request.mimetype.startswith('text/')
     try:
-        # Check if the device exists
-        device = Device.query.filter_by(device_id=device_id).first()
-        if not device:
-            return jsonify({'error': 'Device not found'}), 404
+        readings = parse_frame_payload(request.get_data(), current_app.config['AES_KEY'], is_base64)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid frame payload', 'details': str(e)}), 400
 
-        # Create a new SensorData record
-        new_sensor_data = SensorData(
-            device_id=device_id,
-            timestamp=datetime.utcnow(),
-            data=data
-        )
-        db.session.add(new_sensor_data)
-        db.session.commit()
+    if not readings:
+        return jsonify({'error': 'Missing readings'}), 400
+    if len(readings) > current_app.config['INGEST_BATCH_MAX']:
+        return jsonify({'error': f"Too many readings (max {current_app.config['INGEST_BATCH_MAX']})"}), 413
 
-        # ✅ Check alerts and create notifications
-        alerts = Alert.query.filter_by(device_id=device_id).all()
-        timestamp_now = datetime.utcnow()
+    return store_batch(readings)
+
+
+@api_bp.route('/ingest-stats', methods=['GET'])
+@login_required
+def ingest_stats():
+    if not current_app.config['WRITE_BUFFER_ENABLED']:
+        return jsonify({'write_buffer': None})
+    return jsonify({'write_buffer': get_write_buffer().stats()})
 
-        for alert in alerts:
-            parts = alert.message.split()
-            if len(parts) < 3:
-                continue
-            param, operator, threshold_str = parts[0], parts[1], parts[-1]
-            try:
-                threshold = float(threshold_str)
-            except ValueError:
-                continue
 
-            value = data.get(param)
-            if value is not None:
+@api_bp.route('/stream/<device_id>', methods=['GET'])
+@login_required
+def stream_device(device_id):
+    hub = get_live_hub()
+    if hub is None:
+        return jsonify({'error': 'Live stream is not enabled'}), 503
+    if not get_device_registry().get(device_id):
+        return jsonify({'error': 'Device not found'}), 404
+
+    keepalive = current_app.config['LIVE_STREAM_KEEPALIVE']
+    subscriber = hub.subscribe(device_id)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
                 try:
-                    value = float(value)
-                except ValueError:
+                    message = json.loads(subscriber.get(timeout=keepalive))
+                except queue.Empty:
+                    yield ': keepalive\n\n'  # Also how a disconnected client is noticed
                     continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            hub.unsubscribe(device_id, subscriber)
 
-                trigger = False
-                if operator == "Greater" and value > threshold:
-                    trigger = True
-                elif operator == "Less" and value < threshold:
-                    trigger = True
-                elif operator == "Equal" and value == threshold:
-                    trigger = True
-
-                if trigger:
-                    notification = Notification(
-                        alert_id=alert.id,
-                        device_id=device_id,
-                        alert_name=alert.alert_type,
-                        message=alert.message,
-                        timestamp=timestamp_now,
-                        seen=False
-                    )
-                    db.session.add(notification)
-
-        db.session.commit()  # commit any notifications
-
-        return jsonify({'message': 'Demo data pushed successfully'}), 201
-
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
+    # Unbuffered through nginx; each open stream holds a worker thread/greenlet
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @api_bp.route('/get-charts/<device_id>', methods=['GET'])
 @login_required
 def get_charts(device_id):
     try:
+        validators = device_validators(Device.device_id == device_id)
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
+
         # Fetch saved chart configurations for the device
         charts = Chart.query.filter_by(device_id=device_id).order_by(Chart.position.asc()).all()
         chart_list = [
@@ -479,7 +889,7 @@ def get_charts(device_id):
             }
             for chart in charts
         ]
-        return jsonify({'charts': chart_list})
+        return with_validators(jsonify({'charts': chart_list}), validators)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch chart configurations', 'details': str(e)}), 500
 
@@ -502,7 +912,7 @@ def create_chart():
 
     try:
         # Check if the device exists
-        device = Device.query.filter_by(device_id=device_id).first()
+        device = get_device_registry().get(device_id)
         if not device:
             return jsonify({'error': 'Device not found'}), 404
 
@@ -517,6 +927,7 @@ def create_chart():
             position=position
         )
         db.session.add(new_chart)
+        touch_devices([device_id])
         db.session.commit()
 
         return jsonify({'message': 'Chart created successfully'}), 201
@@ -536,6 +947,7 @@ def delete_chart(chart_id):
 
         # Delete the chart
         db.session.delete(chart)
+        touch_devices([chart.device_id])
         db.session.commit()
 
         return jsonify({'message': 'Chart deleted successfully'}), 200
@@ -580,7 +992,7 @@ def create_alert():
 
     try:
         # Check if the device exists
-        device = Device.query.filter_by(device_id=device_id).first()
+        device = get_device_registry().get(device_id)
         if not device:
             return jsonify({'error': 'Device not found'}), 404
 
@@ -591,10 +1003,8 @@ def create_alert():
             message=f"{alert_parameter} {alert_gate} {alert_value}"
         )
         db.session.add(new_alert)
-
-    
-
         db.session.commit()
+        get_alert_engine().invalidate(device_id)
 
 
         # Create a notification for the new alert
@@ -605,6 +1015,7 @@ def create_alert():
             seen=False
         )
         db.session.add(new_notification)
+        touch_devices([device_id])
         db.session.commit()
 
         return jsonify({'message': 'Alert and notification created successfully'}), 201
@@ -627,7 +1038,10 @@ def delete_alert(alert_id):
 
         # ✅ Then delete the alert
         db.session.delete(alert)
+        touch_devices([alert.device_id])
         db.session.commit()
+        get_alert_engine().invalidate(alert.device_id)
+        get_alert_engine().forget(alert.id)
 
         return jsonify({'message': 'Alert deleted successfully'}), 200
     except Exception as e:
@@ -637,9 +1051,17 @@ def delete_alert(alert_id):
 @api_bp.route('/get-notifications/<device_id>', methods=['GET'])
 @login_required
 def get_notifications(device_id):
+    since = request.args.get('since', type=int)  # Id of the newest notification the client already has
     try:
+        validators = device_validators(Device.device_id == device_id)
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
+
         # Fetch notifications for the specified device
-        notifications = Notification.query.filter_by(device_id=device_id).order_by(Notification.timestamp.desc()).all()
+        query = Notification.query.filter_by(device_id=device_id)
+        if since is not None:
+            query = query.filter(Notification.id > since)
+        notifications = query.order_by(Notification.timestamp.desc()).all()
         unseen_count = Notification.query.filter_by(device_id=device_id, seen=False).count()
 
         notification_list = [
@@ -653,7 +1075,7 @@ def get_notifications(device_id):
             for notification in notifications
         ]
 
-        return jsonify({'notifications': notification_list, 'unseen_count': unseen_count})
+        return with_validators(jsonify({'notifications': notification_list, 'unseen_count': unseen_count}), validators)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch notifications', 'details': str(e)}), 500
 
@@ -664,6 +1086,7 @@ def mark_notifications_seen(device_id):
     try:
         # Update all unseen notifications for the device to seen
         Notification.query.filter_by(device_id=device_id, seen=False).update({'seen': True})
+        touch_devices([device_id])
         db.session.commit()
 
         return jsonify({'message': 'All notifications marked as seen'}), 200
@@ -681,32 +1104,22 @@ def overall_stats():
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        # Get all devices owned by the user
-        user_devices = Device.query.filter_by(user_id=user.id).all()
-        device_ids = [d.device_id for d in user_devices]
+        validators = device_validators(Device.user_id == user.id, salt=int(datetime.utcnow().timestamp() // 60))
+        if not_modified(validators):
+            return with_validators(Response(status=304), validators)
 
-        total_devices = len(device_ids)
-
-        # Fetch active devices (with data in last 30 minutes)
-        thirty_minutes_ago = datetime.utcnow() - timedelta(minutes=30)  # Changed from 30 days to 30 minutes
-
-        active_devices = (
-            db.session.query(SensorData.device_id)
-            .filter(
-                SensorData.device_id.in_(device_ids),  # Only consider devices owned by the user
-                SensorData.timestamp >= thirty_minutes_ago  # Check if data exists in the last 30 minutes
-            )
-            .distinct()
-            .count()
-        )
+        # Same activity rule as get-devices (reported in the last 30 minutes)
+        summaries = device_summaries(user.id)
+        total_devices = len(summaries)
+        active_devices = sum(1 for summary in summaries if summary['is_active'])
 
         inactive_devices = total_devices - active_devices
 
-        return jsonify({
+        return with_validators(jsonify({
             'total_devices': total_devices,
             'active_devices': active_devices,
             'inactive_devices': inactive_devices
-        })
+        }), validators)
     except Exception as e:
         return jsonify({'error': f'Failed to fetch overall stats - details: {str(e)}'}), 500
 
@@ -741,7 +1154,9 @@ def edit_device():
         device.device_type = device_type.strip()
         device.device_description = device_description.strip()
         device.device_coordinates = device_coordinates.strip()
+        touch_devices([device_id])
         db.session.commit()
+        get_device_registry().invalidate(device_id)
 
         return jsonify({'message': 'Device updated successfully'}), 200
     except Exception as e:
@@ -802,12 +1217,21 @@ def delete_device():
 
         # Optional: Delete related data
         SensorData.query.filter_by(device_id=device_id).delete()
+        SensorValue.query.filter_by(device_id=device_id).delete()
+        SensorRollup.query.filter_by(device_id=device_id).delete()
+        DeviceState.query.filter_by(device_id=device_id).delete()
         Notification.query.filter_by(device_id=device_id).delete()
+        alert_ids = [alert_id for (alert_id,) in db.session.query(Alert.id).filter_by(device_id=device_id)]
         Alert.query.filter_by(device_id=device_id).delete()
         Chart.query.filter_by(device_id=device_id).delete()
 
         db.session.delete(device)
         db.session.commit()
+        delete_archive(device_id)
+        get_device_registry().invalidate(device_id)
+        get_alert_engine().invalidate(device_id)
+        for alert_id in alert_ids:
+            get_alert_engine().forget(alert_id)
 
         return jsonify({'message': 'Device deleted successfully'}), 200
 
@@ -0,0 +1,219 @@
+"""Cold-storage tier for old SensorData rows.
+
+Readings older than the retention age are moved out of MySQL into one
+gzip-compressed, column-oriented JSON file per device and month::
+
+    <ARCHIVE_DIR>/<device_id>/<YYYY-MM>.json.gz
+    {"id": [...], "ts": [epoch ms, ...], "params": {"temperature": [...], ...}}
+
+Parameters missing from a reading are stored as null. Hourly and daily
+rollups stay in the database, so long-range charts keep working without
+touching the archive; minute rollups are pruned with the hot rows.
+"""
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from . import db
+from .models import SensorData, SensorValue, SensorRollup
+from .rollups import RESOLUTIONS, bucket_start
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_ms(timestamp):
+    return int((timestamp - EPOCH).total_seconds() * 1000)
+
+
+def _from_ms(ms):
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def hot_cutoff():
+    """Oldest timestamp guaranteed to still be in the hot tables, or None without retention."""
+    days = current_app.config['RETENTION_DAYS']
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
+
+def archive_dir():
+    return current_app.config['ARCHIVE_DIR']
+
+
+def _month_path(device_id, month):
+    return os.path.join(archive_dir(), str(device_id), f"{month}.json.gz")
+
+
+def _read_file(path):
+    """Return the rows of one archive file as [(id, ts_ms, data)]."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            columns = json.load(f)
+    except FileNotFoundError:
+        return []
+    params = columns['params']
+    rows = []
+    for i, (row_id, ts) in enumerate(zip(columns['id'], columns['ts'])):
+        data = {name: values[i] for name, values in params.items() if values[i] is not None}
+        rows.append((row_id, ts, data))
+    return rows
+
+
+def _write_file(path, rows):
+    names = sorted({name for _, _, data in rows for name in data})
+    columns = {
+        'id': [row_id for row_id, _, _ in rows],
+        'ts': [ts for _, ts, _ in rows],
+        'params': {name: [data.get(name) for _, _, data in rows] for name in names},
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(columns, f, separators=(',', ':'))
+    os.replace(tmp_path, path)  # Readers only ever see complete files
+
+
+def _merge_into_file(path, new_rows):
+    # Keyed by id so re-archiving after a crash between file write and delete is harmless
+    merged = {row[0]: row for row in _read_file(path)}
+    merged.update({row[0]: row for row in new_rows})
+    _write_file(path, sorted(merged.values(), key=lambda row: (row[1], row[0])))
+
+
+def archive_old_readings(cutoff, chunk_size=5000):
+    """Move SensorData (and its SensorValue copies) older than ``cutoff`` into archive files.
+
+    Works oldest-first in chunks of whole timestamps: files are written, then
+    the chunk is deleted from the hot tables and committed. Returns the number
+    of rows moved.
+    """
+    moved = 0
+    while True:
+        records = (
+            SensorData.query.filter(SensorData.timestamp < cutoff)
+            .order_by(SensorData.timestamp.asc(), SensorData.id.asc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not records:
+            break
+        if len(records) == chunk_size:
+            # SensorValue rows are matched by timestamp, so a chunk must never split one:
+            # leave the readings at the boundary timestamp for the next chunk
+            boundary = records[-1].timestamp
+            whole = [record for record in records if record.timestamp < boundary]
+            records = whole or SensorData.query.filter(SensorData.timestamp == boundary).order_by(SensorData.id.asc()).all()
+
+        partitions = defaultdict(list)
+        newest = {}
+        for record in records:
+            data = record.data if isinstance(record.data, dict) else {}
+            partitions[(record.device_id, record.timestamp.strftime('%Y-%m'))].append(
+                (record.id, _to_ms(record.timestamp), data)
+            )
+            newest[record.device_id] = max(newest.get(record.device_id, record.timestamp), record.timestamp)
+        for (device_id, month), rows in partitions.items():
+            _merge_into_file(_month_path(device_id, month), rows)
+
+        try:
+            ids = [record.id for record in records]
+            SensorData.query.filter(SensorData.id.in_(ids)).delete(synchronize_session=False)
+            for device_id, last_timestamp in newest.items():
+                SensorValue.query.filter(
+                    SensorValue.device_id == device_id,
+                    SensorValue.timestamp <= last_timestamp
+                ).delete(synchronize_session=False)
+                # Minute buckets are as numerous as readings; hour/day rollups are kept forever
+                SensorRollup.query.filter(
+                    SensorRollup.device_id == device_id,
+                    SensorRollup.resolution == RESOLUTIONS[0],
+                    SensorRollup.bucket_start < bucket_start(last_timestamp, RESOLUTIONS[0])
+                ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.expunge_all()
+        moved += len(records)
+    return moved
+
+
+def run_retention(days=None, chunk_size=5000):
+    """Archive everything older than ``days`` (default RETENTION_DAYS); 0 disables retention."""
+    days = current_app.config['RETENTION_DAYS'] if days is None else days
+    if not days:
+        return 0
+    started = time.perf_counter()
+    moved = archive_old_readings(datetime.utcnow() - timedelta(days=days), chunk_size)
+    print(f"Archived {moved} readings older than {days} days in {time.perf_counter() - started:.1f}s")
+    return moved
+
+
+def _months_between(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def read_archive(device_id, start=None, end=None):
+    """Archived readings of a device as [{'time', 'data'}], oldest first."""
+    return list(iter_archive_range(device_id, start, end))
+
+
+def iter_archive_range(device_id, start=None, end=None):
+    """Yield archived readings of a device in [start, end] as {'time', 'data'}, one month file at a time."""
+    device_dir = os.path.join(archive_dir(), str(device_id))
+    if not os.path.isdir(device_dir):
+        return
+    available = sorted(name[:-len('.json.gz')] for name in os.listdir(device_dir) if name.endswith('.json.gz'))
+    if not available:
+        return
+    if start is not None or end is not None:
+        wanted = set(_months_between(
+            start or datetime.strptime(available[0], '%Y-%m'),
+            end or datetime.strptime(available[-1], '%Y-%m')
+        ))
+        available = [month for month in available if month in wanted]
+
+    start_ms = _to_ms(start) if start is not None else None
+    end_ms = _to_ms(end) if end is not None else None
+    for month in available:
+        for _, ts, data in _read_file(_month_path(device_id, month)):
+            if (start_ms is None or ts >= start_ms) and (end_ms is None or ts <= end_ms):
+                yield {'time': _from_ms(ts), 'data': data}
+
+
+def iter_archive(device_id, after=None, descending=False):
+    """Yield archived readings as {'id', 'time', 'data'} in (time, id) order, one month file at a time.
+
+    ``after`` is an exclusive (time, id) keyset position in the iteration order.
+    """
+    device_dir = os.path.join(archive_dir(), str(device_id))
+    if not os.path.isdir(device_dir):
+        return
+    months = sorted(name[:-len('.json.gz')] for name in os.listdir(device_dir) if name.endswith('.json.gz'))
+    if descending:
+        months.reverse()
+    after_key = (_to_ms(after[0]), after[1]) if after is not None else None
+    after_month = after[0].strftime('%Y-%m') if after is not None else None
+    for month in months:
+        if after_month is not None and (month > after_month if descending else month < after_month):
+            continue
+        rows = _read_file(_month_path(device_id, month))
+        if descending:
+            rows.reverse()
+        for row_id, ts, data in rows:
+            if after_key is not None and ((ts, row_id) >= after_key if descending else (ts, row_id) <= after_key):
+                continue
+            yield {'id': row_id, 'time': _from_ms(ts), 'data': data}
+
+
+def delete_archive(device_id):
+    device_dir = os.path.join(archive_dir(), str(device_id))
+    if os.path.isdir(device_dir):
+        for name in os.listdir(device_dir):
+            os.remove(os.path.join(device_dir, name))
+        os.rmdir(device_dir)
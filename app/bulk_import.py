@@ -0,0 +1,235 @@
+"""Bulk import of historical readings (e.g. SD-card logs) from CSV or NDJSON.
+
+CSV: a header with ``device_id`` and ``timestamp`` (ISO-8601 or epoch
+seconds); every other column is a parameter, or a single ``data`` column
+holds the reading as JSON. Numeric cells are stored as numbers and empty
+cells are skipped; NaN and Infinity are rejected in both formats, since
+the JSON data column cannot store them.
+
+NDJSON: one ``{"device_id", "timestamp", "data"}`` object per line.
+
+Files are parsed as streams and written through ingest_readings in
+batches, one transaction per batch.
+"""
+import csv
+import json
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from . import db
+from .models import SensorData
+from .ingest import ingest_readings, parse_timestamp
+from .archive import read_archive
+
+FORMATS = ('csv', 'ndjson')
+
+# Per-row problems kept in the report; the rest are only counted
+MAX_ERROR_SAMPLES = 20
+
+# Archived (device, month) timestamp sets kept during an import, least recently used dropped first
+ARCHIVE_CACHE_MONTHS = 64
+
+
+def _cell(value):
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if not math.isfinite(number):
+        raise ValueError(f"Non-finite number {value}")  # The JSON data column cannot store NaN or Infinity
+    return number
+
+
+def _finite(text):
+    number = float(text)
+    if not math.isfinite(number):
+        raise ValueError(f"Non-finite number {text}")
+    return number
+
+
+def _reject_constant(name):
+    raise ValueError(f"Non-finite number {name}")
+
+
+def _loads(text):
+    """json.loads that rejects NaN, Infinity and overflowing numbers."""
+    return json.loads(text, parse_float=_finite, parse_constant=_reject_constant)
+
+
+def iter_csv_readings(stream):
+    """Yield (line number, reading or ValueError) for a text stream of CSV rows."""
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or 'device_id' not in reader.fieldnames or 'timestamp' not in reader.fieldnames:
+        raise ValueError('CSV header must include device_id and timestamp')
+    params = [name for name in reader.fieldnames if name not in ('device_id', 'timestamp')]
+    for row in reader:
+        line = reader.line_num
+        try:
+            if 'data' in params:
+                data = _loads(row['data'] or '{}')
+            else:
+                data = {name: _cell(row[name]) for name in params if row.get(name) not in (None, '')}
+        except ValueError as e:
+            yield line, ValueError(f'Invalid data: {e}')
+            continue
+        yield line, {'device_id': row['device_id'], 'timestamp': row['timestamp'], 'data': data}
+
+
+def iter_ndjson_readings(stream):
+    """Yield (line number, reading or ValueError) for a text stream of NDJSON lines."""
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, _loads(text)
+        except ValueError as e:
+            yield line, ValueError(f'Invalid JSON: {e}')
+
+
+def _to_ms(timestamp):
+    # Archive files keep millisecond precision
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def _months(low, high):
+    year, month = low.year, low.month
+    while (year, month) <= (high.year, high.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _archived_times(device_id, low, high, cache):
+    """Archived reading times of a device between low and high.
+
+    ``cache`` is an LRU OrderedDict of month files already read, bounded by
+    ARCHIVE_CACHE_MONTHS so a long backfill does not hold the whole archive.
+    """
+    times = set()
+    for year, month in _months(low, high):
+        key = (device_id, year, month)
+        if key in cache:
+            cache.move_to_end(key)
+        else:
+            start = datetime(year, month, 1)
+            end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+            cache[key] = {row['time'] for row in read_archive(device_id, start, end - timedelta(milliseconds=1))}
+            while len(cache) > ARCHIVE_CACHE_MONTHS:
+                cache.popitem(last=False)
+        times |= cache[key]
+    return times
+
+
+def _existing_keys(batch, archive_cache):
+    """(device_id, timestamp) pairs of a batch that are already stored, hot or archived.
+
+    The hot tables are checked in one query; archived months are read from
+    their files, with recently used ones cached in ``archive_cache``.
+    """
+    spans = {}
+    for device_id, timestamp in batch:
+        low, high = spans.get(device_id, (timestamp, timestamp))
+        spans[device_id] = (min(low, timestamp), max(high, timestamp))
+    query = db.session.query(SensorData.device_id, SensorData.timestamp).filter(or_(*(
+        and_(SensorData.device_id == device_id, SensorData.timestamp.between(low, high))
+        for device_id, (low, high) in spans.items()
+    )))
+    existing = {(device_id, timestamp) for device_id, timestamp in query} & set(batch)
+    archived = {device_id: _archived_times(device_id, low, high, archive_cache) for device_id, (low, high) in spans.items()}
+    existing.update(key for key in batch if _to_ms(key[1]) in archived[key[0]])
+    return existing
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.error_samples = []
+        self.started = time.perf_counter()
+
+    def error(self, line, message):
+        self.errors += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'error_samples': self.error_samples,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows / seconds, 1) if seconds else None,
+        }
+
+
+def import_readings(lines, batch_size=5000, check_alerts=False, skip_duplicates=True, allowed_device_ids=None, on_batch=None):
+    """Import (line, reading) pairs from iter_csv_readings/iter_ndjson_readings.
+
+    Alerts are not evaluated unless ``check_alerts``: historical data should
+    not notify. With ``skip_duplicates`` readings whose (device_id,
+    timestamp) is already stored (hot or archived), or repeated in the
+    file, are skipped.
+    ``on_batch(report)`` is called after each committed batch. Returns the
+    report as a dict.
+    """
+    report = ImportReport()
+    seen = set()
+    archive_cache = OrderedDict()
+    batch = []
+
+    def flush():
+        items = batch
+        if skip_duplicates:
+            existing = _existing_keys([(reading['device_id'], reading['timestamp']) for _, reading in items], archive_cache)
+            report.duplicates += sum(1 for _, reading in items if (reading['device_id'], reading['timestamp']) in existing)
+            items = [(line, reading) for line, reading in items if (reading['device_id'], reading['timestamp']) not in existing]
+        if items:
+            results = ingest_readings([reading for _, reading in items], check_alerts=check_alerts, publish=False)
+            for (line, _), result in zip(items, results):
+                if result['status'] == 'ok':
+                    report.imported += 1
+                else:
+                    report.error(line, result['error'])
+        if on_batch is not None:
+            on_batch(report)
+
+    for line, reading in lines:
+        report.rows += 1
+        if isinstance(reading, Exception):
+            report.error(line, str(reading))
+            continue
+        if not isinstance(reading, dict) or not reading.get('device_id') or not isinstance(reading.get('data'), dict):
+            report.error(line, 'Missing device_id or data')
+            continue
+        if reading.get('timestamp') in (None, ''):
+            report.error(line, 'Missing timestamp')  # Historical data without a time cannot be placed
+            continue
+        try:
+            timestamp = parse_timestamp(reading['timestamp'])
+        except (TypeError, ValueError, OverflowError, OSError):
+            report.error(line, 'Invalid timestamp')
+            continue
+        device_id = str(reading['device_id'])
+        if allowed_device_ids is not None and device_id not in allowed_device_ids:
+            report.error(line, 'Device not found')
+            continue
+        if skip_duplicates:
+            key = (device_id, timestamp)
+            if key in seen:
+                report.duplicates += 1
+                continue
+            seen.add(key)
+
+        batch.append((line, {'device_id': device_id, 'timestamp': timestamp, 'data': reading['data']}))
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return report.as_dict()
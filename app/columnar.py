@@ -0,0 +1,113 @@
+"""Column-oriented encodings of history rows.
+
+JSON (``format=columnar``)::
+
+    {"t": [epoch ms, ...], "data": {"temperature": [...], ...}}
+
+Rollup rows add ``"min"`` and ``"max"`` objects of the same shape, and
+gap-filled responses a ``"synthetic"`` array of booleans. Parameters missing
+from a row are null.
+
+Packed binary (``Accept: application/vnd.farmiot.columns``), little-endian::
+
+    header: version u8 | row count u32 | series count u16
+    t:      int64[row count] (epoch ms)
+    series: name length u8 | name (utf-8) | float32[row count] (NaN = missing)
+
+Rollup min/max series are named ``<param>:min`` and ``<param>:max``; the
+``synthetic`` flags travel as a series named ``:synthetic`` (1.0 or 0.0). The same
+columnar document is also available as msgpack when the package is installed.
+"""
+import struct
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for application/x-msgpack
+    msgpack = None
+
+VERSION = 1
+HEADER = struct.Struct('<BIH')
+
+JSON_MIMETYPE = 'application/json'
+PACKED_MIMETYPE = 'application/vnd.farmiot.columns'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+
+def mimetypes():
+    """Response types this install can produce, JSON first."""
+    return [JSON_MIMETYPE, PACKED_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+
+
+def epoch_ms(records):
+    return np.array([record['time'] for record in records], dtype='datetime64[ms]').astype(np.int64)
+
+
+def _column(records, key, name):
+    return [(record.get(key) or {}).get(name) for record in records]
+
+
+def to_columns(records):
+    """Pivot [{'time', 'data'[, 'min', 'max']}] rows into the columnar JSON document."""
+    names = sorted({name for record in records for name in (record['data'] or {})})
+    columns = {
+        't': epoch_ms(records).tolist(),
+        'data': {name: _column(records, 'data', name) for name in names},
+    }
+    if any('min' in record for record in records):
+        columns['min'] = {name: _column(records, 'min', name) for name in names}
+        columns['max'] = {name: _column(records, 'max', name) for name in names}
+    if any(record.get('synthetic') for record in records):
+        columns['synthetic'] = [bool(record.get('synthetic')) for record in records]
+    return columns
+
+
+def _float_array(values):
+    array = np.full(len(values), np.nan, dtype='<f4')
+    for i, value in enumerate(values):
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            array[i] = float(value)
+        except (TypeError, ValueError):
+            pass  # Non-numeric values have no packed representation
+    return array
+
+
+def pack_columns(columns):
+    """Encode a to_columns document in the packed binary layout."""
+    series = list(columns['data'].items())
+    for key in ('min', 'max'):
+        series.extend((f"{name}:{key}", values) for name, values in columns.get(key, {}).items())
+    if 'synthetic' in columns:
+        series.append((':synthetic', [float(flag) for flag in columns['synthetic']]))
+
+    parts = [HEADER.pack(VERSION, len(columns['t']), len(series)), np.asarray(columns['t'], dtype='<i8').tobytes()]
+    for name, values in series:
+        # Cut at 255 bytes on a character boundary so the name still decodes
+        encoded = name.encode('utf-8')[:255].decode('utf-8', 'ignore').encode('utf-8')
+        parts.append(struct.pack('<B', len(encoded)) + encoded)
+        parts.append(_float_array(values).tobytes())
+    return b''.join(parts)
+
+
+def unpack_columns(body):
+    """Inverse of pack_columns, for clients and tests; missing values come back as NaN."""
+    version, rows, count = HEADER.unpack_from(body, 0)
+    if version != VERSION:
+        raise ValueError(f'Unsupported columns version {version}')
+    offset = HEADER.size
+    t = np.frombuffer(body, dtype='<i8', count=rows, offset=offset)
+    offset += rows * 8
+    series = {}
+    for _ in range(count):
+        length = body[offset]
+        name = body[offset + 1:offset + 1 + length].decode('utf-8')
+        offset += 1 + length
+        series[name] = np.frombuffer(body, dtype='<f4', count=rows, offset=offset)
+        offset += rows * 4
+    return t, series
+
+
+def pack_msgpack(columns):
+    return msgpack.packb(columns, use_bin_type=True)
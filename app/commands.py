@@ -0,0 +1,174 @@
+import time
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import func
+from flask.cli import with_appcontext
+from . import db
+from .models import SensorData, SensorValue, SensorRollup
+from .timeseries import backfill_chunk
+from .rollups import update_rollups, bucket_start, RESOLUTIONS
+from .archive import run_retention
+from .schema import upgrade_schema
+from .device_state import seed_device_states
+from .bulk_import import FORMATS as IMPORT_FORMATS, iter_csv_readings, iter_ndjson_readings, import_readings
+
+
+@click.command('backfill-sensor-values')
+@click.option('--chunk-size', default=5000, show_default=True, help='SensorData rows per transaction.')
+@click.option('--start-id', default=0, show_default=True, help='Resume after this SensorData id.')
+@with_appcontext
+def backfill_sensor_values(chunk_size, start_id):
+    """Copy numeric fields of existing SensorData rows into SensorValue.
+
+    Runs in id order, one commit per chunk, and skips readings that are
+    already present, so it can be stopped and re-run safely.
+    """
+    last_id = start_id
+    total_rows = total_values = 0
+    started = time.perf_counter()
+    while True:
+        records = (
+            SensorData.query.filter(SensorData.id > last_id)
+            .order_by(SensorData.id.asc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not records:
+            break
+        total_values += backfill_chunk(records)
+        db.session.commit()
+        total_rows += len(records)
+        last_id = records[-1].id
+        db.session.expunge_all()
+        click.echo(f"Backfilled up to id {last_id}: {total_rows} readings, {total_values} values")
+    click.echo(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+@click.command('rebuild-rollups')
+@click.option('--device-id', default=None, help='Only rebuild this device.')
+@click.option('--chunk-size', default=20000, show_default=True, help='SensorValue rows per batch.')
+@click.option('--window-days', default=7, show_default=True, help='Days of one device rebuilt per transaction.')
+@click.option('--until', default=None, help='Rebuild buckets before this day (ISO date, default today UTC).')
+@with_appcontext
+def rebuild_rollups(device_id, chunk_size, window_days, until):
+    """Recompute SensorRollup from SensorValue (rollups are kept current on ingest after that).
+
+    Works per device and window of days, one short transaction each, so
+    ingest is never blocked for long. Each window's buckets are deleted,
+    then rebuilt from the values committed by then (by id); values committed
+    later re-add themselves through their own ingest upserts, so counting
+    them here too would double them. Only buckets before --until are rebuilt.
+    """
+    if db.session.query(SensorValue.id).first() is None:
+        click.echo("No values to roll up")
+        return
+    end = bucket_start(datetime.fromisoformat(until) if until else datetime.utcnow(), RESOLUTIONS[-1])
+    window = timedelta(days=window_days)
+    if device_id:
+        device_ids = [device_id]
+    else:
+        device_ids = [value for (value,) in db.session.query(SensorValue.device_id).distinct().order_by(SensorValue.device_id)]
+    db.session.commit()  # Release the read snapshot before the per-window transactions
+
+    total = 0
+    started = time.perf_counter()
+    for device in device_ids:
+        first = db.session.query(func.min(SensorValue.timestamp)).filter(SensorValue.device_id == device).scalar()
+        window_start = bucket_start(first, RESOLUTIONS[-1]) if first else end
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            SensorRollup.query.filter(
+                SensorRollup.device_id == device,
+                SensorRollup.bucket_start >= window_start,
+                SensorRollup.bucket_start < window_end
+            ).delete(synchronize_session=False)
+            # Read in the same transaction as the delete: late or imported values committed
+            # before it lost their upserts and must be rescanned, later ones keep theirs
+            max_id = db.session.query(func.max(SensorValue.id)).scalar() or 0
+            last_id = 0
+            while True:
+                values = (
+                    db.session.query(SensorValue.id, SensorValue.device_id, SensorValue.timestamp, SensorValue.param_id, SensorValue.value)
+                    .filter(
+                        SensorValue.device_id == device,
+                        SensorValue.timestamp >= window_start,
+                        SensorValue.timestamp < window_end,
+                        SensorValue.id > last_id,
+                        SensorValue.id <= max_id
+                    )
+                    .order_by(SensorValue.id.asc())
+                    .limit(chunk_size)
+                    .all()
+                )
+                if not values:
+                    break
+                update_rollups([
+                    {'device_id': v.device_id, 'timestamp': v.timestamp, 'param_id': v.param_id, 'value': v.value}
+                    for v in values
+                ])
+                total += len(values)
+                last_id = values[-1].id
+            # Day-aligned windows hold whole buckets of every resolution, so readers never see a partial one
+            db.session.commit()
+            window_start = window_end
+        click.echo(f"Rolled up device {device}: {total} values so far")
+    click.echo(f"Rolled up {total} values before {end.date()} in {time.perf_counter() - started:.1f}s")
+
+
+@click.command('archive-sensor-data')
+@click.option('--days', type=int, default=None, help='Archive readings older than this (default RETENTION_DAYS).')
+@click.option('--chunk-size', default=5000, show_default=True, help='SensorData rows per transaction.')
+@with_appcontext
+def archive_sensor_data(days, chunk_size):
+    """Move old readings from the hot tables into compressed monthly archive files."""
+    moved = run_retention(days, chunk_size)
+    click.echo(f"Archived {moved} readings")
+
+
+@click.command('import-readings')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None, help='Default: from the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Readings per transaction.')
+@click.option('--alerts/--no-alerts', default=False, show_default=True, help='Evaluate alert rules for imported readings.')
+@click.option('--skip-duplicates/--keep-duplicates', default=True, show_default=True,
+              help='Skip readings whose device_id and timestamp are already stored.')
+@with_appcontext
+def import_readings_command(path, fmt, batch_size, alerts, skip_duplicates):
+    """Import historical readings from a CSV or NDJSON file (e.g. an SD-card log)."""
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        lines = iter_csv_readings(f) if fmt == 'csv' else iter_ndjson_readings(f)
+        report = import_readings(
+            lines, batch_size, check_alerts=alerts, skip_duplicates=skip_duplicates,
+            on_batch=lambda r: click.echo(f"{r.rows} rows read, {r.imported} imported, {r.duplicates} duplicates, {r.errors} errors")
+        )
+    for sample in report['error_samples']:
+        click.echo(f"Line {sample['line']}: {sample['error']}")
+    click.echo(
+        f"Imported {report['imported']} of {report['rows']} rows in {report['seconds']:.1f}s "
+        f"({report['rows_per_second']} rows/s, {report['duplicates']} duplicates, {report['errors']} errors)"
+    )
+
+
+@click.command('seed-device-state')
+@with_appcontext
+def seed_device_state():
+    """Create latest-reading state rows for devices that last reported before the device_state table existed."""
+    click.echo(f"Seeded {seed_device_states()} devices")
+
+
+@click.command('upgrade-schema')
+@with_appcontext
+def upgrade_schema_command():
+    """Add columns and indexes that db.create_all() cannot add to existing tables."""
+    applied = upgrade_schema()
+    click.echo(f"Added {', '.join(applied)}" if applied else "Schema is up to date")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_sensor_values)
+    app.cli.add_command(rebuild_rollups)
+    app.cli.add_command(archive_sensor_data)
+    app.cli.add_command(import_readings_command)
+    app.cli.add_command(upgrade_schema_command)
+    app.cli.add_command(seed_device_state)
@@ -11,6 +11,59 @@ class Config:
     RQ_REDIS_URL = os.getenv("REDIS_URL")
     AES_KEY = os.getenv("AES_KEY").encode()
 
+    # Ingestion
+    INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "5000"))
+    INGEST_ASYNC = os.getenv("INGEST_ASYNC", "0") == "1"  # Enqueue readings to RQ and answer 202
+    INGEST_JOB_RESULT_TTL = int(os.getenv("INGEST_JOB_RESULT_TTL", "300"))
+
+    # Group-commit write buffer for synchronous ingestion
+    WRITE_BUFFER_ENABLED = os.getenv("WRITE_BUFFER_ENABLED", "0") == "1"
+    WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "500"))
+    WRITE_BUFFER_MAX_WAIT_MS = float(os.getenv("WRITE_BUFFER_MAX_WAIT_MS", "50"))
+    WRITE_BUFFER_TIMEOUT = float(os.getenv("WRITE_BUFFER_TIMEOUT", "10"))  # Seconds a request waits for its flush
+
+    # Process-local device registry cache
+    DEVICE_CACHE_TTL = int(os.getenv("DEVICE_CACHE_TTL", "300"))
+    DEVICE_CACHE_NEGATIVE_TTL = int(os.getenv("DEVICE_CACHE_NEGATIVE_TTL", "30"))
+    DEVICE_CACHE_REDIS_INVALIDATION = os.getenv("DEVICE_CACHE_REDIS_INVALIDATION", "0") == "1"  # Broadcast invalidations to all workers
+
+    # Compiled alert rules are cached per device; other workers pick up changes after the TTL
+    ALERT_RULE_CACHE_TTL = int(os.getenv("ALERT_RULE_CACHE_TTL", "60"))
+    # Alerts notify when a value crosses into alarm; 0 = no reminders while it stays there
+    ALERT_RENOTIFY_SECONDS = int(os.getenv("ALERT_RENOTIFY_SECONDS", "0"))
+    ALERT_STATE_BACKEND = os.getenv("ALERT_STATE_BACKEND", "memory")  # "memory" (per process) or "redis" (shared)
+
+    # History endpoints read numeric values from SensorValue (and rollups for max_points) when enabled.
+    # Off by default: existing deployments must run `flask backfill-sensor-values` before turning it on
+    TYPED_READS = os.getenv("TYPED_READS", "0") == "1"
+    HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "5000"))  # Largest ?limit= for cursor-paginated history
+
+    # Tiered retention: readings older than RETENTION_DAYS move to ARCHIVE_DIR (0 = keep everything hot)
+    RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'archive')))
+
+    # Server-Sent Events at /stream/<device_id>, fanned out through Redis pub/sub (needs REDIS_URL)
+    LIVE_STREAM_ENABLED = os.getenv("LIVE_STREAM_ENABLED", "1") == "1"
+    LIVE_STREAM_KEEPALIVE = int(os.getenv("LIVE_STREAM_KEEPALIVE", "15"))  # Seconds between comment pings
+    LIVE_STREAM_QUEUE_SIZE = int(os.getenv("LIVE_STREAM_QUEUE_SIZE", "100"))  # Events buffered per client before dropping
+
+    # Bulk exports run as RQ jobs and are written to EXPORT_DIR (shared by the web and RQ workers)
+    EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'exports')))
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+    EXPORT_JOB_TIMEOUT = int(os.getenv("EXPORT_JOB_TIMEOUT", "3600"))
+    EXPORT_RESULT_TTL = int(os.getenv("EXPORT_RESULT_TTL", "86400"))  # Seconds a finished export stays downloadable
+
+    # Readings per transaction for POST /import (the import-readings CLI takes --batch-size)
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+    # Weather for demo readings: "open-meteo" or "offline" (no network); results are shared per grid cell
+    WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "open-meteo")
+    WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+    WEATHER_ERROR_TTL = int(os.getenv("WEATHER_ERROR_TTL", "60"))  # Seconds a failed lookup is not retried
+    WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", "0.1"))  # ~11 km cells
+    WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "5"))
+    WEATHER_POOL_SIZE = int(os.getenv("WEATHER_POOL_SIZE", "10"))
+
     # Session config
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SECURE = False  # Set to True in production (HTTPS)
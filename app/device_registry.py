@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+import redis
+from .models import Device
+
+INVALIDATION_CHANNEL = 'farmiot:device-invalidate'
+
+# Immutable snapshot of a Device row; attribute names match the model
+DeviceInfo = namedtuple('DeviceInfo', [
+    'device_id', 'user_id', 'device_name', 'device_type',
+    'device_description', 'device_coordinates', 'registered_at'
+])
+
+_registry_lock = threading.Lock()
+
+
+def _snapshot(device):
+    return DeviceInfo(
+        device_id=device.device_id,
+        user_id=device.user_id,
+        device_name=device.device_name,
+        device_type=device.device_type,
+        device_description=device.device_description,
+        device_coordinates=device.device_coordinates,
+        registered_at=device.registered_at
+    )
+
+
+class DeviceRegistry:
+    """Process-local device_id -> DeviceInfo cache with TTL.
+
+    Unknown IDs are cached too (for ``negative_ttl``) so bad devices hammering
+    the ingest endpoints do not each cost a query. Entries are dropped
+    explicitly when a device is registered, edited or deleted; with a Redis
+    URL the invalidation is broadcast to every web worker.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30, redis_url=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._redis = redis.from_url(redis_url) if redis_url else None
+        self._listener = None
+
+    def get(self, device_id):
+        return self.get_many([device_id]).get(str(device_id))
+
+    def get_many(self, device_ids):
+        """Return {device_id: DeviceInfo} for the known IDs, querying only cache misses."""
+        self._ensure_listener()
+        now = time.monotonic()
+        found = {}
+        missing = set()
+        with self._lock:
+            for device_id in device_ids:
+                device_id = str(device_id)
+                entry = self._entries.get(device_id)
+                if entry is None or entry[0] <= now:
+                    missing.add(device_id)
+                elif entry[1] is not None:
+                    found[device_id] = entry[1]
+
+        if missing:
+            loaded = {device.device_id: _snapshot(device) for device in Device.query.filter(Device.device_id.in_(missing))}
+            with self._lock:
+                for device_id in missing:
+                    info = loaded.get(device_id)
+                    ttl = self.ttl if info is not None else self.negative_ttl
+                    self._entries[device_id] = (now + ttl, info)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, device_id):
+        device_id = str(device_id)
+        with self._lock:
+            self._entries.pop(device_id, None)
+        if self._redis is not None:
+            try:
+                self._redis.publish(INVALIDATION_CHANNEL, device_id)
+            except redis.RedisError as e:
+                print(f"Device cache invalidation publish failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _ensure_listener(self):
+        if self._redis is None or (self._listener is not None and self._listener.is_alive()):
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='device-registry-invalidation', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything cached before the subscription may have missed an invalidation
+                self.clear()
+                for message in pubsub.listen():
+                    device_id = message['data'].decode() if isinstance(message['data'], bytes) else str(message['data'])
+                    with self._lock:
+                        self._entries.pop(device_id, None)
+            except redis.RedisError as e:
+                print(f"Device cache invalidation listener error: {e}")
+                self.clear()
+                time.sleep(5)
+
+
+def get_device_registry():
+    """Return the app's device registry, creating it on first use."""
+    app = current_app._get_current_object()
+    with _registry_lock:
+        registry = app.extensions.get('device_registry')
+        if registry is None:
+            registry = DeviceRegistry(
+                ttl=app.config['DEVICE_CACHE_TTL'],
+                negative_ttl=app.config['DEVICE_CACHE_NEGATIVE_TTL'],
+                redis_url=app.config['RQ_REDIS_URL'] if app.config['DEVICE_CACHE_REDIS_INVALIDATION'] else None
+            )
+            app.extensions['device_registry'] = registry
+    return registry
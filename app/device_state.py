@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, func, and_
+from . import db
+from .models import Device, DeviceState, SensorData, Notification
+
+# A device counts as active if it reported within this window
+ACTIVE_WINDOW = timedelta(minutes=30)
+
+
+def _insert_ignore():
+    stmt = insert(DeviceState)
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        return stmt.prefix_with('IGNORE')
+    if dialect == 'sqlite':
+        return stmt.prefix_with('OR IGNORE')
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(DeviceState).on_conflict_do_nothing()
+    return stmt
+
+
+def update_device_state(readings):
+    """Record the newest of the given (device_id, timestamp, data) readings per device (caller commits).
+
+    The conditional UPDATE only moves last_seen forward, so late or
+    out-of-order readings never overwrite a newer state.
+    """
+    latest = {}
+    for device_id, timestamp, data in readings:
+        if device_id not in latest or timestamp >= latest[device_id][0]:
+            latest[device_id] = (timestamp, data)
+
+    for device_id, (timestamp, data) in sorted(latest.items()):
+        values = {'last_seen': timestamp, 'data': data, 'params': list(data.keys())}
+        stmt = (
+            update(DeviceState)
+            .where(DeviceState.device_id == device_id, DeviceState.last_seen <= timestamp)
+            .values(**values)
+        )
+        if db.session.execute(stmt).rowcount:
+            continue
+        # No row yet (or a newer one exists): insert, then retry the update in case a concurrent insert won
+        db.session.execute(_insert_ignore(), [dict(values, device_id=device_id)])
+        db.session.execute(stmt)
+
+
+def touch_devices(device_ids):
+    """Bump the change counter of the given devices (caller commits)."""
+    device_ids = sorted(set(device_ids))
+    if device_ids:
+        db.session.execute(
+            update(Device)
+            .where(Device.device_id.in_(device_ids))
+            .values(data_version=Device.data_version + 1, data_changed_at=datetime.utcnow())
+        )
+
+
+def device_versions(*criteria):
+    """Return {device_id: (data_version, data_changed_at)} for the devices matching ``criteria``."""
+    rows = db.session.query(Device.device_id, Device.data_version, Device.data_changed_at).filter(*criteria)
+    return {device_id: (version, changed_at) for device_id, version, changed_at in rows}
+
+
+def _as_dict(state):
+    return {'last_seen': state.last_seen, 'data': state.data or {}, 'params': state.params or []}
+
+
+def latest_readings(device_ids):
+    """Return {device_id: {'last_seen', 'data', 'params'}} for devices that have a state row.
+
+    Read-only: devices without a state row (e.g. ones that last reported
+    before the table existed and were not seeded) have no latest reading.
+    """
+    return {
+        state.device_id: _as_dict(state)
+        for state in DeviceState.query.filter(DeviceState.device_id.in_(set(device_ids)))
+    }
+
+
+def seed_device_states(chunk_size=500):
+    """Create state rows from the newest SensorData row of devices that have none; returns how many were seeded."""
+    missing = [
+        device_id for (device_id,) in
+        db.session.query(Device.device_id)
+        .outerjoin(DeviceState, DeviceState.device_id == Device.device_id)
+        .filter(DeviceState.device_id.is_(None))
+        .order_by(Device.device_id)
+    ]
+    seeded = 0
+    for i in range(0, len(missing), chunk_size):
+        newest = (
+            db.session.query(SensorData.device_id, func.max(SensorData.timestamp).label('timestamp'))
+            .filter(SensorData.device_id.in_(missing[i:i + chunk_size]))
+            .group_by(SensorData.device_id)
+            .subquery()
+        )
+        rows = db.session.query(SensorData.device_id, SensorData.timestamp, SensorData.data).join(
+            newest, and_(SensorData.device_id == newest.c.device_id, SensorData.timestamp == newest.c.timestamp)
+        )
+        readings = {device_id: (device_id, timestamp, data if isinstance(data, dict) else {}) for device_id, timestamp, data in rows}
+        update_device_state(list(readings.values()))
+        db.session.commit()
+        seeded += len(readings)
+    return seeded
+
+
+def latest_reading(device_id):
+    """Latest state of one device, or None if it never reported."""
+    return latest_readings([device_id]).get(device_id)
+
+
+def device_summaries(user_id, now=None):
+    """Return [{'device', 'last_seen', 'is_active', 'unseen_notifications'}] for all of a user's devices.
+
+    Uses a fixed number of set-based queries however many devices the user
+    has: devices joined to their state, grouped unseen-notification counts,
+    and one grouped SensorData lookup for devices without a state row yet.
+    """
+    now = now or datetime.utcnow()
+    rows = (
+        db.session.query(Device, DeviceState.last_seen)
+        .outerjoin(DeviceState, DeviceState.device_id == Device.device_id)
+        .filter(Device.user_id == user_id)
+        .order_by(Device.id)
+        .all()
+    )
+    if not rows:
+        return []
+
+    user_devices = db.session.query(Device.device_id).filter(Device.user_id == user_id)
+    unseen = dict(
+        db.session.query(Notification.device_id, func.count(Notification.id))
+        .filter(Notification.device_id.in_(user_devices), Notification.seen.is_(False))
+        .group_by(Notification.device_id)
+    )
+
+    last_seen = {device.device_id: seen for device, seen in rows}
+    missing = [device_id for device_id, seen in last_seen.items() if seen is None]
+    if missing:
+        last_seen.update(
+            db.session.query(SensorData.device_id, func.max(SensorData.timestamp))
+            .filter(SensorData.device_id.in_(missing))
+            .group_by(SensorData.device_id)
+        )
+
+    return [
+        {
+            'device': device,
+            'last_seen': last_seen[device.device_id],
+            'is_active': last_seen[device.device_id] is not None and now - last_seen[device.device_id] < ACTIVE_WINDOW,
+            'unseen_notifications': unseen.get(device.device_id, 0)
+        }
+        for device, _ in rows
+    ]
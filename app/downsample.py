@@ -0,0 +1,96 @@
+import numpy as np
+from .rollups import EPOCH
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` points that keep the visual shape.
+
+    The bucket walk is inherently sequential (each pick depends on the
+    previous one), but all per-point work inside a bucket is vectorized.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the inner points; first and last points are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """Indices of the min and max point in each of ``threshold // 2`` equal-count buckets."""
+    n = len(y)
+    buckets = max(threshold // 2, 1)
+    if threshold >= n:
+        return np.arange(n)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))  # Sorted by bucket, then by value inside each bucket
+    first = np.searchsorted(bucket[order], np.arange(buckets), side='left')
+    last = np.searchsorted(bucket[order], np.arange(buckets), side='right') - 1
+    return np.unique(np.concatenate([order[first], order[last]]))
+
+
+def _numeric_column(rows, param):
+    y = np.full(len(rows), np.nan)
+    for i, row in enumerate(rows):
+        value = (row['data'] or {}).get(param)
+        if value is not None and not isinstance(value, bool):
+            try:
+                y[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+    return y
+
+
+def downsample_rows(rows, max_points, method='lttb'):
+    """Reduce [{'time', 'data', ...}] rows to at most ``max_points``.
+
+    Every numeric parameter is downsampled on its own; the result is the
+    union of the rows picked for any parameter, so each returned row keeps
+    all of its values and the input order is preserved. The per-parameter
+    budget shrinks until the union fits; the first and last rows are
+    always kept.
+    """
+    if not max_points or len(rows) <= max_points:
+        return rows
+
+    x = np.fromiter(((row['time'] - EPOCH).total_seconds() for row in rows), dtype=np.float64, count=len(rows))
+    columns = []
+    for param in sorted({param for row in rows for param in (row['data'] or {})}):
+        y = _numeric_column(rows, param)
+        present = np.flatnonzero(np.isfinite(y))
+        if len(present):
+            columns.append((present, y[present]))
+
+    budget = max_points
+    while True:
+        keep = [np.array([0, len(rows) - 1])]
+        for present, y in columns:
+            if method == 'minmax':
+                picked = minmax_indices(y, budget)
+            else:
+                picked = lttb_indices(x[present], y, budget)
+            keep.append(present[picked])
+        keep = np.unique(np.concatenate(keep))
+        if len(keep) <= max_points or budget <= 3:
+            break
+        budget = max(3, min(budget - 1, budget * max_points // len(keep)))
+    if len(keep) > max_points:
+        # More parameters than the budget can serve separately: thin the union evenly
+        keep = keep[np.unique(np.linspace(0, len(keep) - 1, max_points).round().astype(np.int64))]
+    return [rows[i] for i in keep]
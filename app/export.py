@@ -0,0 +1,161 @@
+"""Bulk export of readings to CSV or Parquet files, run as RQ jobs.
+
+Rows are streamed per device (archive first, then hot SensorData read with
+``yield_per``), so memory stays bounded by one chunk however large the
+export. One column per parameter; CSV keeps raw values, Parquet stores
+parameters as float64 with non-numeric values as null.
+"""
+import csv
+import os
+import time
+from flask import current_app
+from . import db
+from .models import SensorData, SensorValue, DeviceState
+from .archive import iter_archive_range
+from .timeseries import param_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: Parquet exports are only offered when pyarrow is installed
+    pa = None
+
+FORMATS = ('csv', 'parquet')
+
+
+def available_formats():
+    return FORMATS if pa is not None else ('csv',)
+
+
+def export_path(job_id, fmt):
+    return os.path.join(current_app.config['EXPORT_DIR'], f"{job_id}.{fmt}")
+
+
+def purge_expired_exports():
+    """Delete export files older than EXPORT_RESULT_TTL; their jobs have expired too."""
+    export_dir = current_app.config['EXPORT_DIR']
+    if not os.path.isdir(export_dir):
+        return
+    oldest = time.time() - current_app.config['EXPORT_RESULT_TTL']
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        if os.path.getmtime(path) < oldest:
+            os.remove(path)
+
+
+def export_columns(device_ids):
+    """Parameter names reported by the devices: every typed parameter plus the keys of their latest readings."""
+    names = {
+        param_name(param_id)
+        for (param_id,) in db.session.query(SensorValue.param_id).filter(SensorValue.device_id.in_(device_ids)).distinct()
+    }
+    for (params,) in db.session.query(DeviceState.params).filter(DeviceState.device_id.in_(device_ids)):
+        names.update(params or [])
+    return sorted(name for name in names if name)
+
+
+def _hot_query(device_ids, start, end):
+    query = SensorData.query.filter(SensorData.device_id.in_(device_ids))
+    if start is not None:
+        query = query.filter(SensorData.timestamp >= start)
+    if end is not None:
+        query = query.filter(SensorData.timestamp <= end)
+    return query
+
+
+def iter_export_rows(device_ids, start=None, end=None, chunk_size=5000):
+    """Yield (device_id, timestamp, data) ordered by device, then time."""
+    for device_id in sorted(device_ids):
+        for row in iter_archive_range(device_id, start, end):
+            yield device_id, row['time'], row['data']
+        query = (
+            _hot_query([device_id], start, end)
+            .with_entities(SensorData.timestamp, SensorData.data)
+            .order_by(SensorData.timestamp.asc(), SensorData.id.asc())
+            .yield_per(chunk_size)  # Server-side cursor: rows arrive chunk by chunk
+        )
+        for timestamp, data in query:
+            yield device_id, timestamp, data if isinstance(data, dict) else {}
+
+
+def _number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_csv(path, columns, rows, chunk_size, progress):
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['device_id', 'timestamp'] + columns)
+        for device_id, timestamp, data in rows:
+            writer.writerow([device_id, timestamp.isoformat()] + [data.get(name, '') for name in columns])
+            written += 1
+            if written % chunk_size == 0:
+                progress(written)
+    return written
+
+
+def _write_parquet(path, columns, rows, chunk_size, progress):
+    schema = pa.schema(
+        [('device_id', pa.string()), ('timestamp', pa.timestamp('us'))]
+        + [(name, pa.float64()) for name in columns]
+    )
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='snappy') as writer:
+        batch = []
+
+        def flush():
+            arrays = [
+                pa.array([row[0] for row in batch], pa.string()),
+                pa.array([row[1] for row in batch], pa.timestamp('us')),
+            ] + [pa.array([_number(row[2].get(name)) for row in batch], pa.float64()) for name in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                flush()
+                written += len(batch)
+                batch = []
+                progress(written)
+        if batch:
+            flush()
+            written += len(batch)
+    return written
+
+
+def write_export(job_id, device_ids, start=None, end=None, fmt='csv', params=None, progress=None):
+    """Write the export file for ``job_id`` and return {'path', 'rows', 'format', 'columns'}.
+
+    ``progress(rows_written, rows_total)`` is called after every chunk.
+    The file appears under its final name only once it is complete.
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format {fmt}")
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    columns = sorted(params) if params else export_columns(device_ids)
+    total = _hot_query(device_ids, start, end).count()  # Archived rows are not counted up front
+    report = (lambda written: progress(written, max(total, written))) if progress else (lambda written: None)
+
+    purge_expired_exports()
+    path = export_path(job_id, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    rows = iter_export_rows(device_ids, start, end, chunk_size)
+    try:
+        if fmt == 'parquet':
+            written = _write_parquet(tmp_path, columns, rows, chunk_size, report)
+        else:
+            written = _write_csv(tmp_path, columns, rows, chunk_size, report)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    report(written)
+    return {'path': path, 'rows': written, 'format': fmt, 'columns': columns}
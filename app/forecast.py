@@ -0,0 +1,136 @@
+"""Vectorized forecasts of upcoming readings for many devices at once.
+
+Recent history is loaded for all devices in one grouped query into a
+devices x steps matrix per parameter: the mean of each ``step``-long bucket
+counted back from each device's own end time, NaN where a bucket is empty.
+EWMA levels and least-squares linear trends are then computed for every
+device together with NumPy. Bucket k is labelled by its end time, so
+horizon h is the value expected at ``end + h * step``.
+"""
+import numpy as np
+from datetime import timedelta
+from sqlalchemy import and_, or_
+from . import db
+from .models import SensorValue
+from .timeseries import get_param_ids, param_name, numeric_items
+from .archive import read_archive
+
+METHODS = ('ewma', 'linear')
+
+DEFAULT_STEP = timedelta(minutes=5)
+DEFAULT_STEPS = 48
+DEFAULT_ALPHA = 0.3
+
+# Upper bounds per request, so a tiny step or far horizon cannot blow up a response
+MAX_STEPS = 2000
+MAX_HORIZON = 288
+
+
+def history_matrix(ends, params, step=DEFAULT_STEP, steps=DEFAULT_STEPS):
+    """Return (device_ids, {param: means}, {param: counts}) with arrays of shape (devices, steps).
+
+    ``ends`` is {device_id: end}; the last column covers [end - step, end)
+    and the first [end - steps * step, end - (steps - 1) * step).
+    """
+    device_ids = sorted(ends)
+    params = sorted(set(params))
+    device_index = {device_id: i for i, device_id in enumerate(device_ids)}
+    param_index = {param: i for i, param in enumerate(params)}
+    span = step * steps
+
+    rows = []
+    param_ids = get_param_ids(params, create=False)
+    if device_ids and param_ids:
+        query = db.session.query(
+            SensorValue.device_id, SensorValue.param_id, SensorValue.timestamp, SensorValue.value
+        ).filter(SensorValue.param_id.in_(param_ids.values()), or_(*(
+            and_(SensorValue.device_id == device_id, SensorValue.timestamp >= end - span, SensorValue.timestamp < end)
+            for device_id, end in ends.items()
+        )))
+        rows = [(device_id, param_name(param_id), timestamp, value) for device_id, param_id, timestamp, value in query]
+    # Archiving can run with any --days, so the archive is read whatever RETENTION_DAYS says
+    for device_id, end in ends.items():
+        for row in read_archive(device_id, end - span, end):
+            if row['time'] < end:
+                rows.extend((device_id, param, row['time'], value) for param, value in numeric_items(row['data']) if param in param_index)
+
+    sums = np.zeros((len(params), len(device_ids), steps))
+    counts = np.zeros((len(params), len(device_ids), steps), dtype=np.int64)
+    if rows:
+        param_i = np.array([param_index[row[1]] for row in rows], dtype=np.int64)
+        device_i = np.array([device_index[row[0]] for row in rows], dtype=np.int64)
+        times = np.array([row[2] for row in rows], dtype='datetime64[us]')
+        row_ends = np.array([ends[row[0]] for row in rows], dtype='datetime64[us]')
+        values = np.array([row[3] for row in rows], dtype=np.float64)
+        # Microseconds before the device's end; (0, step] falls in the last column
+        before = (row_ends - times).astype(np.int64)
+        column = steps - 1 - (before - 1) // int(step / timedelta(microseconds=1))
+        keep = (column >= 0) & (column < steps)
+        index = (param_i[keep], device_i[keep], column[keep])
+        np.add.at(sums, index, values[keep])
+        np.add.at(counts, index, 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return device_ids, {param: means[i] for i, param in enumerate(params)}, {param: counts[i] for i, param in enumerate(params)}
+
+
+def ewma(matrix, alpha=DEFAULT_ALPHA):
+    """Exponentially weighted level of each row, oldest column first; empty buckets are skipped, empty rows give NaN."""
+    level = np.full(matrix.shape[0], np.nan)
+    for column in matrix.T:
+        present = ~np.isnan(column)
+        level = np.where(present & np.isnan(level), column, level)
+        level = np.where(present, alpha * column + (1 - alpha) * level, level)
+    return level
+
+
+def linear_trend(matrix):
+    """Least-squares (slope, intercept) of each row against its column index, ignoring NaN.
+
+    Rows with a single value get slope 0; empty rows get a NaN intercept.
+    """
+    present = ~np.isnan(matrix)
+    x = np.arange(matrix.shape[1], dtype=np.float64)
+    y = np.where(present, matrix, 0.0)
+    n = present.sum(axis=1)
+    sx = (present * x).sum(axis=1)
+    sxx = (present * x * x).sum(axis=1)
+    sy = y.sum(axis=1)
+    sxy = (y * x).sum(axis=1)
+    denominator = n * sxx - sx * sx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+        intercept = np.where(n > 0, (sy - slope * sx) / n, np.nan)
+    return slope, intercept
+
+
+def forecast(ends, params, method='ewma', horizon=1, step=DEFAULT_STEP, steps=DEFAULT_STEPS, alpha=DEFAULT_ALPHA):
+    """Return {device_id: {param: {'samples', 'values'}}} with ``horizon`` forecasts per series.
+
+    ``values[h - 1]`` is the value expected at ``ends[device_id] + h * step``;
+    EWMA forecasts are flat. ``samples`` is the number of readings used.
+    Series without readings in the window are omitted. Raises ValueError
+    for an unknown method or out-of-range sizes.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    if not 1 <= steps <= MAX_STEPS:
+        raise ValueError(f'steps must be between 1 and {MAX_STEPS}')
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f'horizon must be between 1 and {MAX_HORIZON}')
+
+    device_ids, means, counts = history_matrix(ends, params, step, steps)
+    result = {device_id: {} for device_id in device_ids}
+    ahead = np.arange(1, horizon + 1, dtype=np.float64)
+    for param, matrix in means.items():
+        if method == 'linear':
+            slope, intercept = linear_trend(matrix)
+            values = intercept[:, None] + slope[:, None] * (steps - 1 + ahead)[None, :]
+        else:
+            values = np.repeat(ewma(matrix, alpha)[:, None], horizon, axis=1)
+        samples = counts[param].sum(axis=1)
+        for i, device_id in enumerate(device_ids):
+            if samples[i]:
+                result[device_id][param] = {'samples': int(samples[i]), 'values': values[i].tolist()}
+    return result
@@ -0,0 +1,102 @@
+"""Compact binary device frames.
+
+Request body (raw, or base64 when sent as text)::
+
+    nonce (12 bytes) | AES-GCM ciphertext | tag (16 bytes)
+
+The key is AES_KEY. The decrypted plaintext is a header followed by frames,
+all little-endian::
+
+    header: version u8 | frame count u16
+    frame:  device_id u64 | timestamp u32 (epoch seconds, UTC) | field count u8
+            then per field: field id u8 | value float32
+"""
+import base64
+import binascii
+import struct
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+VERSION = 1
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+HEADER = struct.Struct('<BH')
+FRAME = struct.Struct('<QIB')
+FIELD = struct.Struct('<Bf')
+
+# Field ids are part of the wire format: only ever append to this table
+FIELD_NAMES = {
+    1: 'temperature',
+    2: 'humidity',
+    3: 'moisture',
+    4: 'batper',
+    5: 'batvtg',
+    6: 'voltage',
+}
+FIELD_IDS = {name: field_id for field_id, name in FIELD_NAMES.items()}
+
+
+def decrypt(body, key):
+    """Authenticate and decrypt a frame payload; raises ValueError if it was tampered with."""
+    if len(body) < NONCE_SIZE + TAG_SIZE:
+        raise ValueError('Payload too short')
+    nonce, ciphertext, tag = body[:NONCE_SIZE], body[NONCE_SIZE:-TAG_SIZE], body[-TAG_SIZE:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+def encrypt(plaintext, key):
+    nonce = get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return nonce + ciphertext + tag
+
+
+def decode_frames(plaintext):
+    """Decode every frame in a decrypted payload into ingest readings."""
+    if len(plaintext) < HEADER.size:
+        raise ValueError('Missing frame header')
+    version, count = HEADER.unpack_from(plaintext, 0)
+    if version != VERSION:
+        raise ValueError(f'Unsupported frame version {version}')
+
+    readings = []
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + FRAME.size > len(plaintext):
+            raise ValueError('Truncated frame')
+        device_id, timestamp, field_count = FRAME.unpack_from(plaintext, offset)
+        offset += FRAME.size
+        end = offset + field_count * FIELD.size
+        if end > len(plaintext):
+            raise ValueError('Truncated frame')
+        data = {}
+        for field_id, value in FIELD.iter_unpack(plaintext[offset:end]):
+            # float32 carries ~7 significant digits; drop the binary noise past that
+            data[FIELD_NAMES.get(field_id, f'field{field_id}')] = float(f'{value:.7g}')
+        offset = end
+        readings.append({'device_id': str(device_id), 'timestamp': timestamp, 'data': data})
+    if offset != len(plaintext):
+        raise ValueError('Trailing bytes after last frame')
+    return readings
+
+
+def encode_frames(readings):
+    """Inverse of decode_frames, for device simulators and firmware test vectors."""
+    parts = [HEADER.pack(VERSION, len(readings))]
+    for reading in readings:
+        fields = [(FIELD_IDS[name], float(value)) for name, value in reading['data'].items()]
+        parts.append(FRAME.pack(int(reading['device_id']), int(reading['timestamp']), len(fields)))
+        parts.extend(FIELD.pack(field_id, value) for field_id, value in fields)
+    return b''.join(parts)
+
+
+def parse_frame_payload(body, key, is_base64=False):
+    """Decode a request body into a list of readings; raises ValueError on any malformed input."""
+    if is_base64:
+        try:
+            body = base64.b64decode(body, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError('Invalid base64 body')
+    return decode_frames(decrypt(body, key))
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, jsonify, session
 from .jwt_utils import login_required, token_required
-from .models import Device, User, SensorData
+from .models import User
+from .device_state import latest_reading
+from .device_registry import get_device_registry
 
 frontend_bp = Blueprint('frontend', __name__)
 
@@ -24,7 +26,7 @@ def device_view(device_id):
     email = session.get('user_email')  # Get the logged-in user's email
     try:
         # Fetch the device from the database
-        device = Device.query.filter_by(device_id=device_id).first()
+        device = get_device_registry().get(device_id)
 
         # Check if the device exists
         if not device:
@@ -32,14 +34,12 @@ def device_view(device_id):
 
         # Check if the device belongs to the logged-in user
         user = User.query.filter_by(email=email).first()
-        if not user or device not in user.devices:  # Assuming a relationship exists
+        if not user or device.user_id != user.id:
             return jsonify({'error': 'Unauthorized access to this device'}), 403
 
         # Fetch the latest data points for the device
-        data_points = {}
-        latest_sensor_data = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.desc()).first()
-        if latest_sensor_data:
-            data_points = latest_sensor_data.data
+        state = latest_reading(device_id)
+        data_points = state['data'] if state else {}
 
         # Pass the device data to the template
         return render_template(
@@ -57,7 +57,7 @@ def device_view_new(device_id):
     email = session.get('user_email')  # Get the logged-in user's email
     try:
         # Fetch the device from the database
-        device = Device.query.filter_by(device_id=device_id).first()
+        device = get_device_registry().get(device_id)
 
         # Check if the device exists
         if not device:
@@ -65,14 +65,12 @@ def device_view_new(device_id):
 
         # Check if the device belongs to the logged-in user
         user = User.query.filter_by(email=email).first()
-        if not user or device not in user.devices:  # Assuming a relationship exists
+        if not user or device.user_id != user.id:
             return jsonify({'error': 'Unauthorized access to this device'}), 403
 
         # Fetch the latest data points for the device
-        data_points = {}
-        latest_sensor_data = SensorData.query.filter_by(device_id=device_id).order_by(SensorData.timestamp.desc()).first()
-        if latest_sensor_data:
-            data_points = latest_sensor_data.data
+        state = latest_reading(device_id)
+        data_points = state['data'] if state else {}
 
         # Pass the device data to the template
         return render_template(
@@ -0,0 +1,91 @@
+"""Read-time gap filling for history rows.
+
+Filled points are synthesized per request, flagged ``'synthetic': True``
+and never written back. Rows are load_history dicts ({'time', 'data'}).
+"""
+import re
+from datetime import datetime, timedelta
+from .timeseries import numeric_items
+
+METHODS = ('locf', 'linear', 'null')
+
+# A reading older than this gets a carried-forward point at "now" by default
+STALE_AFTER = timedelta(minutes=30)
+
+# Upper bound on synthesized points per response, so a tiny interval cannot blow up a request
+MAX_SYNTHETIC_POINTS = 10000
+
+_INTERVAL = re.compile(r'^(\d+)([smhd]?)$')
+_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_interval(value):
+    """Parse '90', '30s', '5m', '1h' or '1d' into a timedelta; raises ValueError."""
+    match = _INTERVAL.match((value or '').strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError('Invalid interval. Use e.g. 30s, 5m, 1h or 1d.')
+    return timedelta(seconds=int(match.group(1)) * _UNITS[match.group(2)])
+
+
+def _synthetic(time, data):
+    return {'time': time, 'data': data, 'synthetic': True}
+
+
+def _interpolate(before, after, time):
+    """Linear fill for numeric parameters present on both sides; anything else is carried forward."""
+    fraction = (time - before['time']) / (after['time'] - before['time'])
+    after_values = dict(numeric_items(after['data'] or {}))
+    data = dict(before['data'] or {})
+    for param, value in numeric_items(before['data'] or {}):
+        if param in after_values:
+            data[param] = value + (after_values[param] - value) * fraction
+    return data
+
+
+def fill_gaps(rows, interval, method='locf', end=None, descending=False):
+    """Insert synthetic points every ``interval`` wherever consecutive readings are further apart.
+
+    With ``end`` the gap after the last reading is filled up to it too; there
+    is nothing to interpolate towards there, so linear fill carries forward.
+    Raises ValueError if more than MAX_SYNTHETIC_POINTS would be produced.
+    """
+    if method not in METHODS:
+        raise ValueError(f"fill must be one of {', '.join(METHODS)}")
+    rows = rows[::-1] if descending else list(rows)
+    if not rows:
+        return rows
+
+    filled = []
+    synthesized = 0
+    for i, before in enumerate(rows):
+        filled.append(before)
+        after = rows[i + 1] if i + 1 < len(rows) else None
+        limit = after['time'] if after is not None else end
+        if limit is None:
+            continue
+        time = before['time'] + interval
+        while time < limit or (after is None and time == limit):
+            if method == 'null':
+                data = {param: None for param in (before['data'] or {})}
+            elif method == 'linear' and after is not None:
+                data = _interpolate(before, after, time)
+            else:
+                data = dict(before['data'] or {})
+            filled.append(_synthetic(time, data))
+            synthesized += 1
+            if synthesized > MAX_SYNTHETIC_POINTS:
+                raise ValueError(f'Gap fill would add more than {MAX_SYNTHETIC_POINTS} points; use a larger interval')
+            time += interval
+    return filled[::-1] if descending else filled
+
+
+def carry_forward(rows, now=None, descending=False):
+    """Append a synthetic copy of the newest reading at ``now`` if that reading is older than STALE_AFTER."""
+    if not rows:
+        return rows
+    now = now or datetime.utcnow()
+    newest = rows[0] if descending else rows[-1]
+    if now - newest['time'] < STALE_AFTER:
+        return rows
+    point = _synthetic(now, dict(newest['data'] or {}))
+    return [point] + rows if descending else rows + [point]
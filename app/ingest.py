@@ -0,0 +1,118 @@
+import math
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from . import db
+from .models import SensorData
+from .device_registry import get_device_registry
+from .alert_engine import get_alert_engine
+from .timeseries import insert_typed_values
+from .device_state import update_device_state, touch_devices
+from .live import publish_ingested
+
+
+def parse_timestamp(value):
+    """Accept an ISO-8601 string or epoch seconds; missing means "now" (UTC)."""
+    if value is None or value == '':
+        return datetime.utcnow()
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    timestamp = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if timestamp.tzinfo is not None:
+        # Stored timestamps are naive UTC
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_non_finite(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_non_finite(v) for v in value)
+    return False
+
+
+def parse_reading(item):
+    """Validate one batch item and return (device_id, timestamp, data)."""
+    if not isinstance(item, dict):
+        raise ValueError('Reading must be an object')
+    device_id = item.get('device_id')
+    data = item.get('data')
+    if not device_id or not data or not isinstance(data, dict):
+        raise ValueError('Missing device_id or data')
+    try:
+        timestamp = parse_timestamp(item.get('timestamp'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('Invalid timestamp')
+    for name, value in data.items():
+        # NaN/Infinity (e.g. from a faulty float32 sensor) cannot be stored in a JSON column
+        if _non_finite(value):
+            raise ValueError(f'Non-finite value for {name}')
+    return str(device_id), timestamp, data
+
+
+def ingest_readings(items, check_alerts=True, publish=True):
+    """Store a batch of readings in one transaction.
+
+    Device IDs are validated against the device registry (one query for cache
+    misses), accepted rows are inserted with one executemany and compiled
+    alert rules are fetched once for every device in the batch. ``publish``
+    pushes the readings to live streams. Returns a list of per-item results
+    in input order.
+    """
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index,) + parse_reading(item))
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    device_ids = {device_id for _, device_id, _, _ in parsed}
+    known = get_device_registry().get_many(device_ids) if device_ids else {}
+
+    rows = []
+    accepted = []
+    for index, device_id, timestamp, data in parsed:
+        if device_id not in known:
+            results[index] = {'index': index, 'status': 'error', 'error': 'Device not found'}
+            continue
+        rows.append({'device_id': device_id, 'timestamp': timestamp, 'data': data})
+        accepted.append((index, device_id, timestamp, data))
+
+    if rows:
+        engine = get_alert_engine() if check_alerts else None
+        evaluation = None
+        try:
+            db.session.execute(insert(SensorData), rows)
+            readings = [(device_id, timestamp, data) for _, device_id, timestamp, data in accepted]
+            insert_typed_values(readings)
+            update_device_state(readings)
+            touch_devices(device_id for _, device_id, _, _ in accepted)
+
+            notifications = []
+            if engine is not None:
+                rules_by_device = engine.rules_for({row['device_id'] for row in rows})
+                # Alert state is edge-triggered, so evaluate each device's readings in time order
+                evaluation = engine.evaluate(
+                    [(device_id, data) for _, device_id, _, data in sorted(accepted, key=lambda item: item[2])],
+                    datetime.utcnow(), rules_by_device
+                )
+                notifications = evaluation.notifications
+                db.session.add_all(notifications)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if evaluation is not None:
+                engine.rollback(evaluation)
+            raise
+        if evaluation is not None:
+            engine.commit(evaluation)
+        if publish:
+            publish_ingested(sorted(readings, key=lambda reading: reading[1]), notifications)
+
+    for index, _, _, _ in accepted:
+        results[index] = {'index': index, 'status': 'ok'}
+    return results
@@ -0,0 +1,118 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+import redis
+
+CHANNEL_PREFIX = 'farmiot:live:'
+
+_hub_lock = threading.Lock()
+
+
+class LiveHub:
+    """Per-device push channel for Server-Sent Events.
+
+    Ingest publishes to ``farmiot:live:<device_id>`` in Redis, so a reading
+    written by any web or RQ worker reaches subscribers on every web worker.
+    Each process keeps a single pattern subscription and fans messages out to
+    its local subscriber queues; a slow client drops events rather than
+    holding up the others.
+    """
+
+    def __init__(self, redis_url, queue_size=100):
+        self.queue_size = queue_size
+        self._redis = redis.from_url(redis_url)
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def publish(self, events):
+        """Publish (device_id, event, payload) tuples in one round trip."""
+        if not events:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for device_id, event, payload in events:
+            pipe.publish(f"{CHANNEL_PREFIX}{device_id}", json.dumps({'event': event, 'data': payload}))
+        pipe.execute()
+
+    def subscribe(self, device_id):
+        self._ensure_listener()
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[str(device_id)].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, device_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(str(device_id))
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[str(device_id)]
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='live-hub', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    channel = message['channel'].decode() if isinstance(message['channel'], bytes) else message['channel']
+                    data = message['data'].decode() if isinstance(message['data'], bytes) else message['data']
+                    with self._lock:
+                        subscribers = list(self._subscribers.get(channel[len(CHANNEL_PREFIX):], ()))
+                    for subscriber in subscribers:
+                        try:
+                            subscriber.put_nowait(data)
+                        except queue.Full:
+                            pass
+            except redis.RedisError as e:
+                print(f"Live stream listener error: {e}")
+                time.sleep(5)
+
+
+def get_live_hub():
+    """Return the app's live hub, or None when streaming is disabled or Redis is not configured."""
+    app = current_app._get_current_object()
+    if not app.config['LIVE_STREAM_ENABLED'] or not app.config['RQ_REDIS_URL']:
+        return None
+    with _hub_lock:
+        hub = app.extensions.get('live_hub')
+        if hub is None:
+            hub = LiveHub(app.config['RQ_REDIS_URL'], queue_size=app.config['LIVE_STREAM_QUEUE_SIZE'])
+            app.extensions['live_hub'] = hub
+    return hub
+
+
+def publish_ingested(readings, notifications):
+    """Best-effort push of committed readings and notifications; never fails the ingest."""
+    hub = get_live_hub()
+    if hub is None:
+        return
+    events = [
+        (device_id, 'reading', {'time': timestamp.isoformat(), 'data': data})
+        for device_id, timestamp, data in readings
+    ]
+    events.extend(
+        (notification.device_id, 'notification', {
+            'id': notification.id,
+            'alert_name': notification.alert_name,
+            'message': notification.message,
+            'time': notification.timestamp.isoformat(),
+            'seen': notification.seen
+        })
+        for notification in notifications
+    )
+    try:
+        hub.publish(events)
+    except redis.RedisError as e:
+        print(f"Live stream publish failed: {e}")
@@ -26,6 +26,9 @@ class Device(db.Model):
     device_coordinates = db.Column(db.String(255))
     registered_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Bumped whenever the device's readings, notifications, charts or details change; drives ETags
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    data_changed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     sensor_data = db.relationship('SensorData', backref='device', lazy=True, cascade=CASCADE_OPTION)
     charts = db.relationship('Chart', backref='device', lazy=True, cascade=CASCADE_OPTION)
@@ -38,6 +41,45 @@ class SensorData(db.Model):
     timestamp = db.Column(db.DateTime, nullable=False)
     data = db.Column(db.JSON)
 
+    __table_args__ = (
+        db.Index('ix_sensor_data_device_ts', 'device_id', 'timestamp'),
+    )
+
+class DeviceState(db.Model):
+    # Latest reading per device, updated on every ingest so readers skip ORDER BY ... LIMIT 1 scans
+    device_id = db.Column(db.String(255), db.ForeignKey('device.device_id'), primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.JSON)
+    params = db.Column(db.JSON)
+
+class SensorParam(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+class SensorValue(db.Model):
+    # Narrow numeric copy of SensorData: one row per (reading, numeric parameter)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    device_id = db.Column(db.String(255), db.ForeignKey('device.device_id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    param_id = db.Column(db.Integer, db.ForeignKey('sensor_param.id'), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sensor_value_device_param_ts', 'device_id', 'param_id', 'timestamp'),
+        db.Index('ix_sensor_value_device_ts', 'device_id', 'timestamp'),
+    )
+
+class SensorRollup(db.Model):
+    # Per-parameter aggregates over fixed buckets (resolution in seconds), maintained on ingest
+    device_id = db.Column(db.String(255), db.ForeignKey('device.device_id'), primary_key=True)
+    param_id = db.Column(db.Integer, db.ForeignKey('sensor_param.id'), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum = db.Column(db.Float, nullable=False, default=0.0)
+    min = db.Column(db.Float, nullable=False)
+    max = db.Column(db.Float, nullable=False)
+
 class Alert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(255), db.ForeignKey('device.device_id'), nullable=False)
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, update, and_, case
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import SensorRollup
+
+# Bucket sizes in seconds, finest first: 1 minute, 1 hour, 1 day
+RESOLUTIONS = (60, 3600, 86400)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(timestamp, resolution):
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def aggregate(value_rows):
+    """Fold SensorValue rows into {(device_id, param_id, resolution, bucket): [count, sum, min, max]}."""
+    buckets = {}
+    for row in value_rows:
+        value = row['value']
+        for resolution in RESOLUTIONS:
+            key = (row['device_id'], row['param_id'], resolution, bucket_start(row['timestamp'], resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                bucket[0] += 1
+                bucket[1] += value
+                if value < bucket[2]:
+                    bucket[2] = value
+                if value > bucket[3]:
+                    bucket[3] = value
+    return buckets
+
+
+def _upsert_statement(dialect):
+    """Native upsert for the dialect, or None to fall back to _merge_rows."""
+    table = SensorRollup.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        return stmt.on_duplicate_key_update(
+            count=table.c['count'] + stmt.inserted['count'],
+            sum=table.c.sum + stmt.inserted.sum,
+            min=func.least(table.c.min, stmt.inserted.min),
+            max=func.greatest(table.c.max, stmt.inserted.max),
+        )
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            least, greatest = func.min, func.max  # SQLite's multi-argument min()/max() are scalar
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            least, greatest = func.least, func.greatest
+        stmt = dialect_insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=['device_id', 'param_id', 'resolution', 'bucket_start'],
+            set_={
+                'count': table.c['count'] + stmt.excluded['count'],
+                'sum': table.c.sum + stmt.excluded.sum,
+                'min': least(table.c.min, stmt.excluded.min),
+                'max': greatest(table.c.max, stmt.excluded.max),
+            }
+        )
+    return None
+
+
+def _merge_rows(rows):
+    """Portable rollup merge: update each bucket in place, inserting it when it does not exist yet."""
+    table = SensorRollup.__table__
+    for row in rows:
+        stmt = (
+            update(table)
+            .where(and_(*(table.c[name] == row[name] for name in ('device_id', 'param_id', 'resolution', 'bucket_start'))))
+            .values(
+                count=table.c['count'] + row['count'],
+                sum=table.c.sum + row['sum'],
+                min=case((table.c.min <= row['min'], table.c.min), else_=row['min']),
+                max=case((table.c.max >= row['max'], table.c.max), else_=row['max']),
+            )
+        )
+        if db.session.execute(stmt).rowcount:
+            continue
+        try:
+            # Savepoint so losing an insert race does not abort the caller's transaction
+            with db.session.begin_nested():
+                db.session.execute(insert(table), [row])
+        except IntegrityError:
+            db.session.execute(stmt)
+
+
+def update_rollups(value_rows):
+    """Merge freshly inserted SensorValue rows into every rollup resolution (caller commits)."""
+    if not value_rows:
+        return 0
+    buckets = aggregate(value_rows)
+    # Sorted keys give concurrent writers the same lock order
+    rows = [
+        {
+            'device_id': device_id, 'param_id': param_id, 'resolution': resolution, 'bucket_start': start,
+            'count': count, 'sum': total, 'min': low, 'max': high
+        }
+        for (device_id, param_id, resolution, start), (count, total, low, high) in sorted(buckets.items())
+    ]
+    stmt = _upsert_statement(db.engine.dialect.name)
+    if stmt is None:
+        _merge_rows(rows)
+    else:
+        db.session.execute(stmt, rows)
+    return len(rows)
+
+
+def pick_resolution(start, end, max_points):
+    """Coarsest rollup whose buckets are no wider than the requested point spacing, or None for raw rows."""
+    if not max_points or max_points <= 0 or end <= start:
+        return None
+    step = (end - start).total_seconds() / max_points
+    chosen = None
+    for resolution in RESOLUTIONS:
+        if resolution <= step:
+            chosen = resolution
+    return chosen
+
+
+def fetch_rollup_rows(device_id, resolution, start, end, param_names):
+    """Rollup buckets as [{'time', 'data' (mean), 'min', 'max', 'count'}], oldest first."""
+    records = (
+        SensorRollup.query
+        .filter(
+            SensorRollup.device_id == device_id,
+            SensorRollup.resolution == resolution,
+            SensorRollup.bucket_start >= bucket_start(start, resolution),
+            SensorRollup.bucket_start <= end
+        )
+        .order_by(SensorRollup.bucket_start.asc())
+    )
+    buckets = OrderedDict()
+    for record in records:
+        name = param_names(record.param_id)
+        row = buckets.get(record.bucket_start)
+        if row is None:
+            row = buckets[record.bucket_start] = {'time': record.bucket_start, 'data': {}, 'min': {}, 'max': {}, 'count': {}}
+        row['data'][name] = record.sum / record.count if record.count else None
+        row['min'][name] = record.min
+        row['max'][name] = record.max
+        row['count'][name] = record.count
+    return list(buckets.values())
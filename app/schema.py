@@ -0,0 +1,52 @@
+"""Additive schema upgrades that db.create_all() cannot make.
+
+create_all only creates missing tables. Columns and indexes added to
+existing tables later (e.g. Device.data_version / data_changed_at and
+ix_sensor_data_device_ts) are compared against the live database here and
+created if missing. Every step is idempotent, so it runs on each startup.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateColumn
+from . import db
+
+
+def _missing(table, inspector):
+    """(missing columns, missing indexes) of a model table that already exists in the database."""
+    columns = {column['name'] for column in inspector.get_columns(table.name)}
+    indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+    return (
+        [column for column in table.columns if column.name not in columns],
+        [index for index in table.indexes if index.name not in indexes],
+    )
+
+
+def upgrade_schema():
+    """Add missing columns and indexes to existing tables; returns the steps applied."""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    applied = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue  # create_all makes new tables complete
+        columns, indexes = _missing(table, inspector)
+        for column in columns:
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}"
+            applied.append(_apply(lambda conn: conn.execute(text(ddl)), f"{table.name}.{column.name}", table, column.name))
+        for index in indexes:
+            applied.append(_apply(lambda conn: index.create(conn), index.name, table, index.name))
+    return [step for step in applied if step]
+
+
+def _apply(step, name, table, key):
+    try:
+        with db.engine.begin() as conn:
+            step(conn)
+    except (OperationalError, ProgrammingError):
+        # Another worker may have applied it first
+        columns, indexes = _missing(table, inspect(db.engine))
+        if any(item.name == key for item in columns + indexes):
+            raise
+        return None
+    return name
@@ -0,0 +1,227 @@
+import math
+import threading
+from datetime import timedelta
+from collections import OrderedDict
+from sqlalchemy import insert, tuple_, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from flask import current_app
+from . import db
+from .models import SensorData, SensorParam, SensorValue
+from .models import SensorRollup
+from .rollups import RESOLUTIONS, update_rollups, pick_resolution, fetch_rollup_rows
+from .archive import read_archive, iter_archive, hot_cutoff
+
+# Parameter name <-> id, shared by every request in the process; rows are never renamed or deleted
+_param_ids = {}
+_param_names = {}
+_param_lock = threading.Lock()
+
+
+def numeric_items(data):
+    """Yield (param, float) for every value in a reading that parses as a finite number."""
+    for param, value in data.items():
+        if isinstance(value, bool) or value is None:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(number):
+            yield param, number
+
+
+def _remember(params):
+    with _param_lock:
+        for param in params:
+            _param_ids[param.name] = param.id
+            _param_names[param.id] = param.name
+
+
+def get_param_ids(names, create=True):
+    """Return {name: id} for the given parameter names, registering new ones if ``create``."""
+    names = set(names)
+    with _param_lock:
+        found = {name: _param_ids[name] for name in names if name in _param_ids}
+    missing = names - found.keys()
+    if missing:
+        _remember(SensorParam.query.filter(SensorParam.name.in_(missing)).all())
+        with _param_lock:
+            found.update({name: _param_ids[name] for name in missing if name in _param_ids})
+        missing = names - found.keys()
+    if missing and create:
+        for name in missing:
+            try:
+                # Savepoint so a concurrent registration of the same name does not abort the caller's transaction
+                with db.session.begin_nested():
+                    db.session.add(SensorParam(name=name))
+            except IntegrityError:
+                pass
+        _remember(SensorParam.query.filter(SensorParam.name.in_(missing)).all())
+        with _param_lock:
+            found.update({name: _param_ids[name] for name in missing if name in _param_ids})
+    return found
+
+
+def param_name(param_id):
+    with _param_lock:
+        name = _param_names.get(param_id)
+    if name is None:
+        param = db.session.get(SensorParam, param_id)
+        if param is not None:
+            _remember([param])
+            name = param.name
+    return name
+
+
+def typed_rows(readings):
+    """Build SensorValue insert rows from (device_id, timestamp, data) tuples."""
+    items = [(device_id, timestamp, list(numeric_items(data))) for device_id, timestamp, data in readings]
+    param_ids = get_param_ids({param for _, _, values in items for param, _ in values})
+    return [
+        {'device_id': device_id, 'timestamp': timestamp, 'param_id': param_ids[param], 'value': value}
+        for device_id, timestamp, values in items
+        for param, value in values
+    ]
+
+
+def insert_typed_values(readings):
+    """Dual-write the numeric fields of readings into SensorValue and its rollups (caller commits)."""
+    rows = typed_rows(readings)
+    if rows:
+        db.session.execute(insert(SensorValue), rows)
+        update_rollups(rows)
+    return len(rows)
+
+
+def fetch_rows(device_id, start=None, end=None, limit=None, descending=False):
+    """Read readings back from SensorValue as [{'time': datetime, 'data': {param: float}}].
+
+    ``limit`` counts readings (distinct timestamps), not value rows.
+    """
+    query = db.session.query(SensorValue.timestamp).filter(SensorValue.device_id == device_id)
+    if start is not None:
+        query = query.filter(SensorValue.timestamp >= start)
+    if end is not None:
+        query = query.filter(SensorValue.timestamp <= end)
+
+    if limit is not None:
+        # Find the window of the newest/oldest ``limit`` readings, then load only that window
+        edge = query.distinct().order_by(
+            SensorValue.timestamp.desc() if descending else SensorValue.timestamp.asc()
+        ).offset(limit - 1).limit(1).scalar()
+        if edge is not None:
+            query = query.filter(SensorValue.timestamp >= edge if descending else SensorValue.timestamp <= edge)
+
+    order = (SensorValue.timestamp.desc(), SensorValue.id.desc()) if descending else (SensorValue.timestamp.asc(), SensorValue.id.asc())
+    values = query.with_entities(SensorValue.timestamp, SensorValue.param_id, SensorValue.value).order_by(*order)
+
+    readings = OrderedDict()
+    for timestamp, param_id, value in values:
+        readings.setdefault(timestamp, {})[param_name(param_id)] = value
+    return [{'time': timestamp, 'data': data} for timestamp, data in readings.items()]
+
+
+def _hot_rows(device_id, start, end, limit, descending):
+    if current_app.config['TYPED_READS']:
+        return fetch_rows(device_id, start, end, limit, descending)
+
+    query = SensorData.query.filter(SensorData.device_id == device_id)
+    if start is not None:
+        query = query.filter(SensorData.timestamp >= start)
+    if end is not None:
+        query = query.filter(SensorData.timestamp <= end)
+    query = query.order_by(SensorData.timestamp.desc() if descending else SensorData.timestamp.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return [{'time': record.timestamp, 'data': record.data} for record in query]
+
+
+def load_history(device_id, start=None, end=None, limit=None, descending=False, max_points=None):
+    """Read a device's history across the hot tables and the archive.
+
+    Hot rows come from the typed store, or from SensorData JSON when
+    TYPED_READS is off. With ``max_points`` the coarsest rollup that still
+    gives about that many points over the range is read instead of raw rows.
+    """
+    typed = current_app.config['TYPED_READS']
+    if typed and max_points and limit is None:
+        if start is None or end is None:
+            first = db.session.query(func.min(SensorRollup.bucket_start)).filter(
+                SensorRollup.device_id == device_id, SensorRollup.resolution == RESOLUTIONS[-1]).scalar()
+            last = db.session.query(func.max(SensorRollup.bucket_start)).filter(
+                SensorRollup.device_id == device_id, SensorRollup.resolution == RESOLUTIONS[0]).scalar()
+            start = start if start is not None else first
+            end = end if end is not None else (last + timedelta(seconds=RESOLUTIONS[0]) if last else None)
+        resolution = pick_resolution(start, end, max_points) if start and end else None
+        cutoff = hot_cutoff()
+        if resolution == RESOLUTIONS[0] and cutoff is not None and start < cutoff:
+            resolution = None  # Minute rollups are pruned together with the hot tier
+        if resolution is not None:
+            rows = fetch_rollup_rows(device_id, resolution, start, end, param_name)
+            return rows[::-1] if descending else rows
+
+    rows = _hot_rows(device_id, start, end, limit, descending)
+    if limit is None or len(rows) < limit:
+        # Archived readings are all older than the hot ones, so the tiers simply concatenate
+        archived = read_archive(device_id, start, end)
+        if archived:
+            if typed:
+                archived = [{'time': row['time'], 'data': dict(numeric_items(row['data']))} for row in archived]
+            rows = rows + archived[::-1] if descending else archived + rows
+            if limit is not None:
+                rows = rows[:limit]
+    return rows
+
+
+def iter_history(device_id, after=None, descending=False, chunk_size=1000):
+    """Yield every reading of a device as {'id', 'time', 'data'} with bounded memory.
+
+    Hot SensorData rows are read in keyset-paginated chunks on (timestamp, id)
+    and archived rows one month file at a time. ``after`` is an exclusive
+    (time, id) position, so a cursor taken from any yielded row resumes
+    right after it.
+    """
+    def hot_after(position):
+        ts, row_id = position
+        if descending:
+            return or_(SensorData.timestamp < ts, and_(SensorData.timestamp == ts, SensorData.id < row_id))
+        return or_(SensorData.timestamp > ts, and_(SensorData.timestamp == ts, SensorData.id > row_id))
+
+    def hot_rows(position):
+        order = (SensorData.timestamp.desc(), SensorData.id.desc()) if descending else (SensorData.timestamp.asc(), SensorData.id.asc())
+        while True:
+            query = db.session.query(SensorData.id, SensorData.timestamp, SensorData.data).filter(SensorData.device_id == device_id)
+            if position is not None:
+                query = query.filter(hot_after(position))
+            chunk = query.order_by(*order).limit(chunk_size).all()
+            for row_id, timestamp, data in chunk:
+                yield {'id': row_id, 'time': timestamp, 'data': data}
+            if len(chunk) < chunk_size:
+                return
+            position = (chunk[-1][1], chunk[-1][0])
+
+    # Archived readings are all older than hot ones: archive then hot ascending, hot then archive descending
+    if descending:
+        yield from hot_rows(after)
+        yield from iter_archive(device_id, after, descending=True)
+    else:
+        yield from iter_archive(device_id, after)
+        yield from hot_rows(after)
+
+
+def backfill_chunk(records):
+    """Copy a chunk of SensorData rows into SensorValue, skipping readings already present."""
+    if not records:
+        return 0
+    keys = {(record.device_id, record.timestamp) for record in records}
+    existing = set(
+        db.session.query(SensorValue.device_id, SensorValue.timestamp)
+        .filter(tuple_(SensorValue.device_id, SensorValue.timestamp).in_(keys))
+        .distinct()
+    )
+    readings = [
+        (record.device_id, record.timestamp, record.data)
+        for record in records
+        if isinstance(record.data, dict) and (record.device_id, record.timestamp) not in existing
+    ]
+    return insert_typed_values(readings)
@@ -0,0 +1,194 @@
+"""Current weather for device coordinates, cached per grid cell.
+
+Coordinates are snapped to a WEATHER_GRID_DEGREES grid and each cell is
+looked up at its centre, so every device on a farm shares one result for
+WEATHER_CACHE_TTL seconds. Concurrent lookups for the same cell wait for a
+single in-flight request. Failures are cached for WEATHER_ERROR_TTL so an
+outage does not turn into a request per device.
+
+Providers: ``open-meteo`` (pooled requests.Session with timeouts) and
+``offline``, a deterministic stand-in that needs no network.
+"""
+import math
+import threading
+import time
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+OPEN_METEO_URL = 'https://api.open-meteo.com/v1/forecast'
+
+_service_lock = threading.Lock()
+
+
+class WeatherError(Exception):
+    pass
+
+
+def parse_coordinates(coord_str):
+    """Parse "lat,lon" into floats; raises ValueError."""
+    lat_str, lon_str = coord_str.split(",")
+    lat, lon = float(lat_str.strip()), float(lon_str.strip())
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Coordinates out of range')
+    return lat, lon
+
+
+class OpenMeteoProvider:
+    """Current temperature and humidity plus today's mean 0-1cm soil moisture, in one request."""
+
+    def __init__(self, timeout=5.0, pool_size=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, lat, lon):
+        params = {
+            'latitude': lat,
+            'longitude': lon,
+            'current': 'temperature_2m,relative_humidity_2m',
+            'daily': 'soil_moisture_0_1cm_mean',
+            'timezone': 'auto',
+            'forecast_days': 1,
+        }
+        try:
+            response = self.session.get(OPEN_METEO_URL, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise WeatherError(str(e))
+        if response.status_code != 200:
+            raise WeatherError(f"API Error: {response.status_code}")
+        try:
+            body = response.json()
+        except ValueError:
+            raise WeatherError('Invalid API response')
+        current = body.get('current', {})
+        soil = body.get('daily', {}).get('soil_moisture_0_1cm_mean') or [None]
+        return {
+            'temperature_celsius': current.get('temperature_2m'),
+            'humidity_percent': current.get('relative_humidity_2m'),
+            'soil_moisture_m3m3': soil[0],
+        }
+
+
+class OfflineProvider:
+    """Plausible conditions from latitude and local solar time, for tests and offline demos."""
+
+    def fetch(self, lat, lon, now=None):
+        now = now or datetime.utcnow()
+        hour = (now.hour + now.minute / 60 + lon / 15) % 24
+        daily = math.cos((hour - 15) / 24 * 2 * math.pi)  # Warmest mid-afternoon
+        temperature = 30 - abs(lat) * 0.4 + 6 * daily
+        return {
+            'temperature_celsius': round(temperature, 1),
+            'humidity_percent': round(min(max(65 - 20 * daily, 5), 100), 1),
+            'soil_moisture_m3m3': round(0.25 - 0.03 * daily, 3),
+        }
+
+
+PROVIDERS = ('open-meteo', 'offline')
+
+
+def make_provider(name, timeout=5.0, pool_size=10):
+    if name == 'open-meteo':
+        return OpenMeteoProvider(timeout=timeout, pool_size=pool_size)
+    if name == 'offline':
+        return OfflineProvider()
+    raise ValueError(f"Unknown weather provider {name}; use one of {', '.join(PROVIDERS)}")
+
+
+class WeatherService:
+    """TTL cache of provider results per grid cell, with one in-flight request per cell."""
+
+    def __init__(self, provider, ttl=600, error_ttl=60, grid_degrees=0.1):
+        self.provider = provider
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.grid_degrees = grid_degrees
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def cell(self, lat, lon):
+        return (math.floor(lat / self.grid_degrees), math.floor(lon / self.grid_degrees))
+
+    def _centre(self, cell):
+        return (
+            round((cell[0] + 0.5) * self.grid_degrees, 4),
+            round((cell[1] + 0.5) * self.grid_degrees, 4),
+        )
+
+    def lookup(self, lat, lon):
+        """Return the conditions dict for the cell containing (lat, lon); raises WeatherError."""
+        key = self.cell(lat, lon)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    result = entry[1]
+                    break
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+            if not leader:
+                event.wait()  # Another thread is fetching this cell; use its result
+                continue
+            try:
+                result = self.provider.fetch(*self._centre(key))
+                ttl = self.ttl
+            except WeatherError as e:
+                result, ttl = e, self.error_ttl
+            except Exception as e:
+                result, ttl = WeatherError(str(e)), self.error_ttl
+            with self._lock:
+                self._entries[key] = (time.monotonic() + ttl, result)
+                del self._inflight[key]
+            event.set()
+            break
+        if isinstance(result, WeatherError):
+            raise result
+        return dict(result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def estimate_temp_hum_moisture(coord_str, service=None):
+    """Current temperature and humidity for "lat,lon" with an empirical soil moisture index, or {"error": ...}."""
+    try:
+        lat, lon = parse_coordinates(coord_str)
+    except ValueError:
+        return {"error": "Invalid coordinate format. Use 'lat,lon'"}
+    try:
+        conditions = (service or get_weather_service()).lookup(lat, lon)
+    except WeatherError as e:
+        return {"error": str(e)}
+    temp = conditions['temperature_celsius']
+    rh = conditions['humidity_percent']
+    if temp is None or rh is None:
+        return {"error": "Temperature or humidity not found"}
+    return {
+        "temperature_celsius": temp,
+        "humidity_percent": rh,
+        "estimated_soil_moisture_index": round(rh / (temp + 1), 2)
+    }
+
+
+def get_weather_service():
+    """Return the app's weather service, creating it on first use."""
+    app = current_app._get_current_object()
+    with _service_lock:
+        service = app.extensions.get('weather_service')
+        if service is None:
+            service = WeatherService(
+                make_provider(app.config['WEATHER_PROVIDER'], app.config['WEATHER_TIMEOUT'], app.config['WEATHER_POOL_SIZE']),
+                ttl=app.config['WEATHER_CACHE_TTL'],
+                error_ttl=app.config['WEATHER_ERROR_TTL'],
+                grid_degrees=app.config['WEATHER_GRID_DEGREES']
+            )
+            app.extensions['weather_service'] = service
+    return service
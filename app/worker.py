@@ -1,28 +1,42 @@
-from . import db
-from .models import SensorData, Alert
-from datetime import datetime
-from sqlalchemy.exc import SQLAlchemyError
+from contextlib import nullcontext
+from flask import has_app_context
+from rq import get_current_job
+from .ingest import ingest_readings
+from .export import write_export
+
+_app = None
+
+def _app_context():
+    # RQ workers import this module outside Flask, so build the app once per worker process
+    global _app
+    if has_app_context():
+        return nullcontext()
+    if _app is None:
+        from . import create_app
+        _app = create_app()
+    return _app.app_context()
+
+def ingest_sensor_readings(readings):
+    """Persist readings enqueued by the ingest endpoints and run their alert checks."""
+    with _app_context():
+        results = ingest_readings(readings)
+    failed = [result for result in results if result['status'] != 'ok']
+    if failed:
+        print(f"Ingest job rejected {len(failed)} of {len(results)} readings: {failed[:5]}")
+    return results
 
 def insert_sensor_data(payload):
-    try:
-        sensor = SensorData(
-            device_id=payload['device_id'],
-            timestamp=datetime.fromisoformat(payload['timestamp']),
-            data=payload['data']
-        )
-        db.session.add(sensor)
-        db.session.commit()
+    """Persist a single reading; alert rules are applied by the shared alert engine."""
+    return ingest_sensor_readings([payload])[0]
+
+def export_sensor_data(device_ids, start=None, end=None, fmt='csv', params=None):
+    """Write an export file for the current job, publishing progress in job.meta."""
+    job = get_current_job()
 
-        # Example: dynamic alert check (voltage check)
-        if 'voltage' in payload['data'] and payload['data']['voltage'] < 3.3:
-            alert = Alert(
-                device_id=sensor.device_id,
-                alert_type="Low Voltage",
-                message=f"Voltage dropped to {payload['data']['voltage']}V"
-            )
-            db.session.add(alert)
-            db.session.commit()
+    def progress(rows_written, rows_total):
+        if job is not None:
+            job.meta['progress'] = {'rows_written': rows_written, 'rows_total': rows_total}
+            job.save_meta()
 
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        print("DB Error:", str(e))
+    with _app_context():
+        return write_export(job.id if job is not None else 'local', device_ids, start, end, fmt, params, progress)
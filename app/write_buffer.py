@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from .ingest import ingest_readings
+
+_buffer_lock = threading.Lock()
+
+
+class WriteBuffer:
+    """Group-commit buffer for incoming readings.
+
+    Request threads submit readings and block on the returned Future. A single
+    flusher thread collects readings across requests and writes them with one
+    multi-row insert (one commit) once ``max_batch`` readings are pending or the
+    oldest one has waited ``max_wait`` seconds.
+    """
+
+    def __init__(self, app, max_batch=500, max_wait=0.05):
+        self._app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'rows': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'flush_seconds_total': 0.0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+
+    def submit(self, reading):
+        future = Future()
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so forked web workers each get their own flusher
+                self._thread = threading.Thread(target=self._run, name='sensor-write-buffer', daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((reading, future))
+            # Wake the flusher to start the wait timer, or to flush a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def cancel(self, future):
+        """Drop a submitted reading the flusher has not picked up yet.
+
+        Returns False once its batch is being written; it will then be
+        stored, just later than the caller waited for.
+        """
+        with self._cond:
+            for i, (_, pending) in enumerate(self._pending):
+                if pending is future:
+                    del self._pending[i]
+                    if not self._pending:
+                        self._oldest = None
+                    future.cancel()
+                    return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while len(self._pending) < self.max_batch:
+                    remaining = self.max_wait - (time.monotonic() - self._oldest)
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                self._oldest = time.monotonic() if self._pending else None
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                results = ingest_readings([reading for reading, _ in batch])
+        except Exception as e:
+            with self._cond:
+                self._stats['failed_flushes'] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['rows'] += len(batch)
+            stats['last_batch_size'] = len(batch)
+            stats['max_batch_size'] = max(stats['max_batch_size'], len(batch))
+            stats['flush_seconds_total'] += elapsed
+            stats['last_flush_ms'] = round(elapsed * 1000, 3)
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], stats['last_flush_ms'])
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        flushes = stats['flushes']
+        flush_seconds_total = stats.pop('flush_seconds_total')
+        stats['mean_batch_size'] = round(stats['rows'] / flushes, 2) if flushes else 0
+        stats['mean_flush_ms'] = round(flush_seconds_total * 1000 / flushes, 3) if flushes else 0
+        stats['max_batch'] = self.max_batch
+        stats['max_wait_ms'] = self.max_wait * 1000
+        return stats
+
+
+def get_write_buffer():
+    """Return the app's write buffer, creating it on first use."""
+    app = current_app._get_current_object()
+    with _buffer_lock:
+        buffer = app.extensions.get('sensor_write_buffer')
+        if buffer is None:
+            buffer = WriteBuffer(
+                app,
+                max_batch=app.config['WRITE_BUFFER_MAX_BATCH'],
+                max_wait=app.config['WRITE_BUFFER_MAX_WAIT_MS'] / 1000.0
+            )
+            app.extensions['sensor_write_buffer'] = buffer
+    return buffer
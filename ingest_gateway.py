@@ -0,0 +1,350 @@
+"""Standalone asyncio ingestion gateway.
+
+Serves the device-facing ingest endpoints without a Flask worker thread per
+connection:
+
+    HTTP  GET /data?device_id=...&key=value   (same contract as the Flask route)
+          POST /data/batch                    (JSON list or {"readings": [...]})
+          POST /data/frames                   (AES-GCM binary frames, see app/frames.py)
+    TCP   one reading per line: "<device_id> key=value key=value [ts=<epoch>]"
+    UDP   same line protocol, one or more lines per datagram
+
+Readings from every connection are pooled and persisted in batches through
+app.ingest.ingest_readings, so the schema, device registry and alert engine
+are the same ones the Flask app uses.
+
+    python ingest_gateway.py --http-port 8081 --tcp-port 9000 --udp-port 9001
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app
+from app.ingest import ingest_readings
+from app.frames import parse_frame_payload
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+IDLE_TIMEOUT = 60
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+class Batcher:
+    """Pools readings from all connections and flushes them through the shared ingest path."""
+
+    def __init__(self, app, max_batch, max_wait, max_pending, flush_threads):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=flush_threads, thread_name_prefix='gateway-flush')
+        self._flush_slots = asyncio.Semaphore(flush_threads)
+        self._flush_tasks = set()
+        self.flushes = 0
+        self.rows = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, readings):
+        """Queue readings and return one future per reading; raises asyncio.QueueFull under overload."""
+        if self.queue.maxsize and self.queue.qsize() + len(readings) > self.queue.maxsize:
+            raise asyncio.QueueFull
+        loop = asyncio.get_running_loop()
+        futures = []
+        for reading in readings:
+            future = loop.create_future()
+            self.queue.put_nowait((reading, future))
+            futures.append(future)
+        return futures
+
+    def _flush_sync(self, readings):
+        with self.app.app_context():
+            return ingest_readings(readings)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Flushes run in threads; the next batch is collected while this one commits.
+            # Waiting for a free slot keeps the queue (and so backpressure) intact when the DB is slow.
+            await self._flush_slots.acquire()
+            task = loop.create_task(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self.executor, self._flush_sync, [reading for reading, _ in batch])
+        except Exception as e:
+            print(f"Gateway flush of {len(batch)} readings failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._flush_slots.release()
+        self.flushes += 1
+        self.rows += len(batch)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def parse_line(line):
+    """Parse "<device_id> key=value ... [ts=<epoch>]" into a reading dict."""
+    parts = line.split()
+    if len(parts) < 2:
+        raise ValueError('Expected "<device_id> key=value ..."')
+    reading = {'device_id': parts[0], 'data': {}}
+    for part in parts[1:]:
+        key, sep, value = part.partition('=')
+        if not sep or not key:
+            raise ValueError(f'Bad field {part!r}')
+        if key == 'ts':
+            reading['timestamp'] = float(value)
+        else:
+            reading['data'][key] = value
+    return reading
+
+
+def summarize(results):
+    stored = sum(1 for result in results if result['status'] == 'ok')
+    return {'stored': stored, 'failed': len(results) - stored, 'results': results}
+
+
+class Gateway:
+    def __init__(self, app, batcher):
+        self.app = app
+        self.batcher = batcher
+        self.aes_key = app.config['AES_KEY']
+        self.batch_max = app.config['INGEST_BATCH_MAX']
+
+    async def store(self, readings):
+        try:
+            futures = self.batcher.submit(readings)
+        except asyncio.QueueFull:
+            return None
+        return await asyncio.gather(*futures)
+
+    # HTTP
+
+    async def handle_http(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Malformed request line'}, keep_alive=False)
+                    return
+                headers = {}
+                for header in header_lines:
+                    name, _, value = header.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': 'Body too large'}, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, payload = await self.route(method, target, headers, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except Exception as e:
+            print(f"Gateway HTTP error: {e}")
+        finally:
+            writer.close()
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        if url.path == '/data' and method == 'GET':
+            params = dict(parse_qsl(url.query))
+            device_id = params.pop('device_id', None)
+            if not device_id or not params:
+                return 400, {'error': 'Missing device_id or data'}
+            results = await self.store([{'device_id': device_id, 'data': params}])
+            if results is None:
+                return 503, {'error': 'Gateway overloaded, retry later'}
+            if results[0]['status'] != 'ok':
+                return 404 if results[0]['error'] == 'Device not found' else 400, {'error': results[0]['error']}
+            return 201, {'message': 'Sensor data stored successfully'}
+
+        if url.path == '/data/batch' and method == 'POST':
+            try:
+                req = json.loads(body)
+            except ValueError:
+                return 400, {'error': 'Invalid JSON body'}
+            readings = req.get('readings') if isinstance(req, dict) else req
+            if not isinstance(readings, list) or not readings:
+                return 400, {'error': 'Missing readings'}
+            return await self.store_batch(readings)
+
+        if url.path == '/data/frames' and method == 'POST':
+            is_base64 = 'encoding=base64' in url.query or headers.get('content-type', '').startswith('text/')
+            try:
+                readings = parse_frame_payload(body, self.aes_key, is_base64)
+            except ValueError as e:
+                return 400, {'error': 'Invalid frame payload', 'details': str(e)}
+            if not readings:
+                return 400, {'error': 'Missing readings'}
+            return await self.store_batch(readings)
+
+        if url.path == '/stats' and method == 'GET':
+            return 200, {
+                'flushes': self.batcher.flushes,
+                'rows': self.batcher.rows,
+                'last_flush_ms': self.batcher.last_flush_ms,
+                'pending': self.batcher.queue.qsize()
+            }
+
+        if url.path in ('/data', '/data/batch', '/data/frames', '/stats'):
+            return 405, {'error': 'Method not allowed'}
+        return 404, {'error': 'Not found'}
+
+    async def store_batch(self, readings):
+        if len(readings) > self.batch_max:
+            return 413, {'error': f'Too many readings (max {self.batch_max})'}
+        results = await self.store(readings)
+        if results is None:
+            return 503, {'error': 'Gateway overloaded, retry later'}
+        summary = summarize(results)
+        return 201 if summary['stored'] else 400, summary
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode()
+        writer.write(head + body)
+        await writer.drain()
+
+    # TCP line protocol
+
+    async def handle_tcp(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError, ValueError):
+                    return
+                if not line:
+                    return
+                line = line.decode('utf-8', 'replace').strip()
+                if not line:
+                    continue
+                try:
+                    reading = parse_line(line)
+                except ValueError as e:
+                    writer.write(f"ERR {e}\n".encode())
+                    continue
+                results = await self.store([reading])
+                if results is None:
+                    writer.write(b"ERR overloaded\n")
+                elif results[0]['status'] == 'ok':
+                    writer.write(b"OK\n")
+                else:
+                    writer.write(f"ERR {results[0]['error']}\n".encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class LineDatagramProtocol(asyncio.DatagramProtocol):
+    """UDP is fire-and-forget: readings are queued, errors are only logged."""
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def datagram_received(self, data, addr):
+        readings = []
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                try:
+                    readings.append(parse_line(line))
+                except ValueError as e:
+                    print(f"Gateway UDP bad line from {addr[0]}: {e}")
+        if readings:
+            try:
+                for future in self.gateway.batcher.submit(readings):
+                    future.add_done_callback(lambda f: f.exception())
+            except asyncio.QueueFull:
+                print(f"Gateway overloaded, dropped {len(readings)} UDP readings from {addr[0]}")
+
+
+async def serve(args):
+    app = create_app()
+    batcher = Batcher(app, args.max_batch, args.max_wait_ms / 1000.0, args.max_pending, args.flush_threads)
+    gateway = Gateway(app, batcher)
+    loop = asyncio.get_running_loop()
+
+    servers = []
+    if args.http_port:
+        servers.append(await asyncio.start_server(gateway.handle_http, args.host, args.http_port,
+                                                  limit=MAX_HEADER_BYTES, backlog=args.backlog))
+        print(f"HTTP ingest listening on {args.host}:{args.http_port}")
+    if args.tcp_port:
+        servers.append(await asyncio.start_server(gateway.handle_tcp, args.host, args.tcp_port, backlog=args.backlog))
+        print(f"TCP line ingest listening on {args.host}:{args.tcp_port}")
+    if args.udp_port:
+        await loop.create_datagram_endpoint(lambda: LineDatagramProtocol(gateway), local_addr=(args.host, args.udp_port))
+        print(f"UDP line ingest listening on {args.host}:{args.udp_port}")
+
+    await batcher.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Asyncio ingestion gateway for Farm-IoT devices')
+    parser.add_argument('--host', default=os.getenv('GATEWAY_HOST', '0.0.0.0'))
+    parser.add_argument('--http-port', type=int, default=int(os.getenv('GATEWAY_HTTP_PORT', '8081')))
+    parser.add_argument('--tcp-port', type=int, default=int(os.getenv('GATEWAY_TCP_PORT', '9000')))
+    parser.add_argument('--udp-port', type=int, default=int(os.getenv('GATEWAY_UDP_PORT', '9001')))
+    parser.add_argument('--max-batch', type=int, default=int(os.getenv('GATEWAY_MAX_BATCH', '1000')))
+    parser.add_argument('--max-wait-ms', type=float, default=float(os.getenv('GATEWAY_MAX_WAIT_MS', '100')))
+    parser.add_argument('--max-pending', type=int, default=int(os.getenv('GATEWAY_MAX_PENDING', '100000')))
+    # More than one flush thread trades strict per-device ordering of alert evaluation for throughput
+    parser.add_argument('--flush-threads', type=int, default=int(os.getenv('GATEWAY_FLUSH_THREADS', '1')))
+    parser.add_argument('--backlog', type=int, default=4096)
+    args = parser.parse_args()
+
+    try:
+        import uvloop  # Optional, noticeably faster with many sockets
+        uvloop.install()
+    except ImportError:
+        pass
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Config is read at import time; an in-memory SQLite database per app keeps tests isolated
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ.setdefault('AES_KEY', '0123456789abcdef')
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')  # Only connects when a job is queued
+os.environ.setdefault('LIVE_STREAM_ENABLED', '0')
+
+from app import create_app  # noqa: E402
+from app import timeseries  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    # Parameter ids are cached per process, but every test starts from an empty database
+    timeseries._param_ids.clear()
+    timeseries._param_names.clear()
+    with app.app_context():
+        yield app
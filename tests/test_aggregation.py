@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Device
+from app.aggregation import window_stats
+from app.archive import archive_old_readings
+from app.ingest import ingest_readings
+
+
+def test_stats_include_rows_archived_without_retention(app, tmp_path):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    app.config['RETENTION_DAYS'] = 0  # archive-sensor-data --days runs regardless
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=60)
+    ingest_readings([
+        {'device_id': '100', 'timestamp': start + timedelta(days=i * 10), 'data': {'temperature': i}}
+        for i in range(6)
+    ], check_alerts=False, publish=False)
+    assert archive_old_readings(now - timedelta(days=30)) == 3
+
+    stats = window_stats(['100'], ['temperature'], start, now)['100']['temperature']
+    assert len(stats) == 1
+    assert stats[0]['count'] == 6
+    assert (stats[0]['min'], stats[0]['max'], stats[0]['mean']) == (0, 5, 2.5)
+
+    stats = window_stats(['100'], ['temperature'], start, now, percentiles=(50,))['100']['temperature']
+    assert stats[0]['count'] == 6 and stats[0]['p50'] == 2.5
@@ -0,0 +1,82 @@
+from datetime import datetime
+import pytest
+from app import db
+from app.models import User, Device, Alert, Notification
+from app.alert_engine import AlertEngine, MemoryAlertState, RedisAlertState, compile_alert
+from app.ingest import ingest_readings
+
+
+@pytest.fixture
+def alert(app):
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    alert = Alert(device_id='100', alert_type='Too hot', message='temperature Greater 30')
+    db.session.add(alert)
+    db.session.commit()
+    return alert
+
+
+def ingest(*temperatures):
+    ingest_readings([{'device_id': '100', 'data': {'temperature': value}} for value in temperatures], publish=False)
+    return Notification.query.count()
+
+
+def test_notifies_on_crossing_into_alarm_only(alert):
+    assert ingest(35) == 1
+    assert ingest(36) == 1  # Still in alarm
+    assert ingest(20) == 1  # Recovered
+    assert ingest(40) == 2
+
+
+def test_batch_is_replayed_in_order(alert):
+    assert ingest(35, 36, 20, 40, 41) == 2
+
+
+def test_failed_commit_does_not_leave_alert_silent(alert, monkeypatch):
+    commit = db.session.commit
+
+    def failing_commit():
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    with pytest.raises(RuntimeError):
+        ingest(35)
+    monkeypatch.setattr(db.session, 'commit', commit)
+
+    # The retried reading still notifies
+    assert ingest(35) == 1
+
+
+def test_renotify_after_cooldown(app, alert):
+    engine = AlertEngine(state=MemoryAlertState(), renotify_seconds=3600)
+    rules = {'100': {'temperature': [compile_alert(alert)]}}
+    now = datetime.utcnow()
+
+    first = engine.evaluate([('100', {'temperature': 35})], now, rules)
+    engine.commit(first)
+    assert len(first.notifications) == 1
+    assert engine.evaluate([('100', {'temperature': 35})], now, rules).notifications == []
+
+    engine.state._notified[alert.id] -= 3600  # Cooldown elapsed
+    assert len(engine.evaluate([('100', {'temperature': 35})], now, rules).notifications) == 1
+
+
+def test_redis_state_claims_once_and_releases(app, alert):
+    fakeredis = pytest.importorskip('fakeredis')
+    state = RedisAlertState.__new__(RedisAlertState)
+    state._redis = fakeredis.FakeRedis()
+    state._prefix = 'test'
+    first, second = AlertEngine(state=state), AlertEngine(state=state)
+    rules = {'100': {'temperature': [compile_alert(alert)]}}
+    now = datetime.utcnow()
+
+    evaluation = first.evaluate([('100', {'temperature': 35})], now, rules)
+    assert len(evaluation.notifications) == 1
+    # A concurrent worker sees the claim and stays quiet
+    assert second.evaluate([('100', {'temperature': 35})], now, rules).notifications == []
+
+    first.rollback(evaluation)
+    assert len(second.evaluate([('100', {'temperature': 35})], now, rules).notifications) == 1
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import pytest
+import app.archive as archive
+from app import db
+from app.models import User, Device, SensorData, SensorValue
+from app.archive import archive_old_readings, read_archive
+from app.ingest import ingest_readings
+
+
+def test_chunks_never_split_a_timestamp(app, tmp_path, monkeypatch):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    # Two readings per instant, so chunks of 3 cut through a shared timestamp
+    old = datetime.utcnow() - timedelta(days=60)
+    ingest_readings([
+        {'device_id': '100', 'timestamp': old + timedelta(minutes=i), 'data': {'temperature': i, 'humidity': copy}}
+        for i in range(5) for copy in range(2)
+    ], check_alerts=False, publish=False)
+
+    # The run stops after its first chunk: what is still hot must be complete
+    merge = archive._merge_into_file
+    calls = []
+
+    def failing_merge(*args):
+        calls.append(args)
+        if len(calls) > 1:
+            raise OSError('disk full')
+        merge(*args)
+
+    monkeypatch.setattr(archive, '_merge_into_file', failing_merge)
+    with pytest.raises(OSError):
+        archive_old_readings(old + timedelta(minutes=3), chunk_size=3)
+    db.session.rollback()
+    for record in SensorData.query:
+        assert SensorValue.query.filter_by(device_id='100', timestamp=record.timestamp).count() == 4
+
+    monkeypatch.setattr(archive, '_merge_into_file', merge)
+    assert archive_old_readings(old + timedelta(minutes=3), chunk_size=3) == 4
+    assert SensorData.query.count() == 4
+    assert len(read_archive('100')) == 6
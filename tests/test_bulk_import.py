@@ -0,0 +1,76 @@
+import io
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import app.bulk_import as bulk_import
+from app import db
+from app.models import User, Device, SensorData
+from app.archive import archive_old_readings
+from app.bulk_import import iter_csv_readings, iter_ndjson_readings, import_readings
+
+
+def add_device(device_id='100'):
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id=device_id, device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+
+def test_non_finite_numbers_are_rejected(app):
+    add_device()
+    csv_file = io.StringIO(
+        "device_id,timestamp,temperature\n"
+        "100,2024-01-01T00:00:00,21.5\n"
+        "100,2024-01-01T00:01:00,nan\n"
+        "100,2024-01-01T00:02:00,inf\n"
+    )
+    report = import_readings(iter_csv_readings(csv_file))
+    assert report['imported'] == 1
+    assert [sample['line'] for sample in report['error_samples']] == [3, 4]
+
+    ndjson_file = io.StringIO(
+        '{"device_id": "100", "timestamp": "2024-01-02T00:00:00", "data": {"t": NaN}}\n'
+        '{"device_id": "100", "timestamp": "2024-01-02T00:01:00", "data": {"t": 1e999}}\n'
+        '{"device_id": "100", "timestamp": "2024-01-02T00:02:00", "data": {"t": 1.5}}\n'
+    )
+    report = import_readings(iter_ndjson_readings(ndjson_file))
+    assert report['imported'] == 1
+    assert report['errors'] == 2
+
+
+def test_archived_readings_count_as_duplicates(app, tmp_path):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    add_device()
+    old = datetime.utcnow().replace(microsecond=0) - timedelta(days=90)
+    lines = [
+        (i + 1, {'device_id': '100', 'timestamp': (old + timedelta(minutes=i)).isoformat(), 'data': {'t': i}})
+        for i in range(10)
+    ]
+    assert import_readings(iter(lines))['imported'] == 10
+    archive_old_readings(datetime.utcnow() - timedelta(days=30))
+    assert SensorData.query.count() == 0
+
+    report = import_readings(iter(lines))
+    assert report['imported'] == 0
+    assert report['duplicates'] == 10
+
+
+def test_archive_cache_is_bounded(app, tmp_path, monkeypatch):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    monkeypatch.setattr(bulk_import, 'ARCHIVE_CACHE_MONTHS', 2)
+    add_device()
+    lines = [
+        (i + 1, {'device_id': '100', 'timestamp': datetime(2023, i + 1, 10).isoformat(), 'data': {'t': i}})
+        for i in range(5)
+    ]
+    assert import_readings(iter(lines))['imported'] == 5
+    archive_old_readings(datetime(2024, 1, 1))
+
+    cache = OrderedDict()
+    times = bulk_import._archived_times('100', datetime(2023, 1, 1), datetime(2023, 5, 31), cache)
+    assert len(times) == 5
+    assert list(cache) == [('100', 2023, 4), ('100', 2023, 5)]
+
+    report = import_readings(iter(lines), batch_size=1)
+    assert report['duplicates'] == 5
@@ -0,0 +1,42 @@
+import math
+import pytest
+from datetime import datetime
+from app.columnar import to_columns, pack_columns, unpack_columns
+
+
+def test_pack_unpack_round_trip():
+    records = [
+        {'time': datetime(2024, 5, 1, 12, 0), 'data': {'temperature': 21.5, 'humidity': 40}},
+        {'time': datetime(2024, 5, 1, 12, 5), 'data': {'temperature': 22.0}, 'synthetic': True},
+    ]
+    t, series = unpack_columns(pack_columns(to_columns(records)))
+
+    assert t.tolist() == [1714564800000, 1714565100000]
+    assert series['temperature'].tolist() == [21.5, 22.0]
+    assert series['humidity'][0] == 40 and math.isnan(series['humidity'][1])
+    assert series[':synthetic'].tolist() == [0.0, 1.0]
+
+
+def test_rollup_min_max_round_trip():
+    records = [{'time': datetime(2024, 5, 1), 'data': {'temperature': 20.0},
+                'min': {'temperature': 18.0}, 'max': {'temperature': 23.5}}]
+    t, series = unpack_columns(pack_columns(to_columns(records)))
+
+    assert series['temperature:min'].tolist() == [18.0]
+    assert series['temperature:max'].tolist() == [23.5]
+    assert ':synthetic' not in series
+
+
+def test_unpack_rejects_unknown_version():
+    body = bytearray(pack_columns(to_columns([{'time': datetime(2024, 5, 1), 'data': {'t': 1}}])))
+    body[0] = 99
+    with pytest.raises(ValueError):
+        unpack_columns(bytes(body))
+
+
+def test_long_names_are_cut_on_a_character_boundary():
+    name = 'é' * 200  # Two bytes each, so byte 255 falls inside a character
+    t, series = unpack_columns(pack_columns(to_columns([{'time': datetime(2024, 5, 1), 'data': {name: 1.5}}])))
+
+    assert list(series) == ['é' * 127]
+    assert series['é' * 127].tolist() == [1.5]
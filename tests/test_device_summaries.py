@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import User, Device, SensorData, Alert, Notification
+from app.device_state import device_summaries
+from app.ingest import ingest_readings
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self)
+
+
+def make_user(email, devices, with_state=True):
+    user = User(email=email)
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    device_ids = [f"{email}-{i}" for i in range(devices)]
+    for device_id in device_ids:
+        db.session.add(Device(device_id=device_id, device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    now = datetime.utcnow()
+    if with_state:
+        ingest_readings([{'device_id': device_id, 'timestamp': now, 'data': {'temperature': 20}} for device_id in device_ids], publish=False)
+    else:
+        # Readings from before the state table existed: SensorData only
+        db.session.add_all(SensorData(device_id=device_id, timestamp=now - timedelta(hours=1), data={'temperature': 20}) for device_id in device_ids)
+        db.session.commit()
+
+    alert = Alert(device_id=device_ids[0], alert_type='temperature > 10', message='hot')
+    db.session.add(alert)
+    db.session.commit()
+    db.session.add(Notification(alert_id=alert.id, device_id=device_ids[0], alert_name='hot', message='m'))
+    db.session.commit()
+    return user
+
+
+def count_statements(user_id):
+    db.session.expire_all()
+    with StatementCounter(db.engine) as counter:
+        summaries = device_summaries(user_id)
+    return counter.count, summaries
+
+
+@pytest.mark.parametrize('with_state', [True, False])
+def test_query_count_does_not_grow_with_devices(app, with_state):
+    one = make_user('one', 1, with_state)
+    many = make_user('many', 40, with_state)
+
+    one_count, one_summaries = count_statements(one.id)
+    many_count, many_summaries = count_statements(many.id)
+
+    assert len(one_summaries) == 1
+    assert len(many_summaries) == 40
+    assert 0 < one_count == many_count
+
+
+def test_summaries_report_activity_and_unseen_notifications(app):
+    user = make_user('a', 3, with_state=True)
+    summaries = device_summaries(user.id)
+
+    assert [summary['device'].device_id for summary in summaries] == ['a-0', 'a-1', 'a-2']
+    assert all(summary['is_active'] for summary in summaries)
+    assert [summary['unseen_notifications'] for summary in summaries] == [1, 0, 0]
+
+
+def test_devices_without_readings_are_inactive(app):
+    user = User(email='b')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='b-0', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    [summary] = device_summaries(user.id)
+    assert summary['last_seen'] is None
+    assert not summary['is_active']
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+import app.archive as archive
+from app import db
+from app.models import User, Device
+from app.archive import archive_old_readings
+from app.export import iter_export_rows
+from app.ingest import ingest_readings
+
+
+def test_export_reads_the_archive_one_month_at_a_time(app, tmp_path, monkeypatch):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    first = datetime(2023, 1, 15)
+    ingest_readings([
+        {'device_id': '100', 'timestamp': first + timedelta(days=31 * i), 'data': {'temperature': i}}
+        for i in range(4)
+    ], check_alerts=False, publish=False)
+    assert archive_old_readings(datetime(2024, 1, 1)) == 4
+
+    read = []
+    read_file = archive._read_file
+    monkeypatch.setattr(archive, '_read_file', lambda path: read.append(path) or read_file(path))
+    rows = iter_export_rows(['100'], start=first, end=datetime(2023, 12, 31))
+    assert next(rows)[2] == {'temperature': 0}
+    assert len(read) == 1
+    assert [data['temperature'] for _, _, data in rows] == [1, 2, 3]
+    assert len(read) == 4
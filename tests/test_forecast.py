@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Device
+from app.archive import archive_old_readings
+from app.forecast import forecast
+from app.ingest import ingest_readings
+
+
+def test_forecast_window_includes_archived_rows(app, tmp_path):
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    app.config['RETENTION_DAYS'] = 0
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    end = datetime.utcnow().replace(microsecond=0)
+    ingest_readings([
+        {'device_id': '100', 'timestamp': end - timedelta(hours=hours), 'data': {'temperature': 10.0}}
+        for hours in (4, 3, 2, 1)
+    ], check_alerts=False, publish=False)
+    assert archive_old_readings(end - timedelta(minutes=150)) == 2
+
+    result = forecast({'100': end}, ['temperature'], step=timedelta(hours=1), steps=6)
+    assert result['100']['temperature'] == {'samples': 4, 'values': [10.0]}
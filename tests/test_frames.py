@@ -0,0 +1,64 @@
+import base64
+import pytest
+from app import db
+from app.models import User, Device, SensorData
+from app.frames import encode_frames, encrypt, parse_frame_payload
+from app.ingest import ingest_readings
+
+KEY = b'0123456789abcdef'
+
+READINGS = [
+    {'device_id': '100', 'timestamp': 1714564800, 'data': {'temperature': 21.5, 'humidity': 40.2}},
+    {'device_id': '18446744073709551615', 'timestamp': 1714564860, 'data': {'batvtg': 3.71}},
+]
+
+
+def test_encode_decode_round_trip():
+    body = encrypt(encode_frames(READINGS), KEY)
+
+    assert parse_frame_payload(body, KEY) == READINGS
+    assert parse_frame_payload(base64.b64encode(body), KEY, is_base64=True) == READINGS
+
+
+@pytest.mark.parametrize('position', [0, 20, -1])
+def test_tampered_payload_is_rejected(position):
+    body = bytearray(encrypt(encode_frames(READINGS), KEY))
+    body[position] ^= 0x01  # Nonce, ciphertext and tag in turn
+
+    with pytest.raises(ValueError):
+        parse_frame_payload(bytes(body), KEY)
+
+
+def test_wrong_key_is_rejected():
+    body = encrypt(encode_frames(READINGS), KEY)
+
+    with pytest.raises(ValueError):
+        parse_frame_payload(body, b'fedcba9876543210')
+
+
+def test_truncated_frame_is_rejected():
+    plaintext = encode_frames(READINGS)[:-2]
+
+    with pytest.raises(ValueError):
+        parse_frame_payload(encrypt(plaintext, KEY), KEY)
+
+
+def test_non_finite_field_is_rejected_per_reading(app):
+    user = User(email='a@b.c')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Device(device_id='100', device_name='d', device_type='t', user_id=user.id))
+    db.session.commit()
+
+    faulty = [
+        {'device_id': '100', 'timestamp': 1714564800, 'data': {'temperature': float('nan')}},
+        {'device_id': '100', 'timestamp': 1714564860, 'data': {'humidity': float('inf')}},
+        {'device_id': '100', 'timestamp': 1714564920, 'data': {'temperature': 21.5}},
+    ]
+    readings = parse_frame_payload(encrypt(encode_frames(faulty), KEY), KEY)
+    results = ingest_readings(readings, check_alerts=False, publish=False)
+
+    assert [result['status'] for result in results] == ['error', 'error', 'ok']
+    assert results[0]['error'] == 'Non-finite value for temperature'
+    assert SensorData.query.count() == 1
@@ -0,0 +1,33 @@
+import threading
+import app.write_buffer as write_buffer
+from app.write_buffer import WriteBuffer
+
+
+def test_cancel_drops_a_queued_reading(app, monkeypatch):
+    written = []
+    monkeypatch.setattr(write_buffer, 'ingest_readings', lambda readings: written.extend(readings) or [])
+    buffer = WriteBuffer(app, max_batch=10, max_wait=60)
+
+    future = buffer.submit({'device_id': '100', 'data': {'t': 1}})
+    assert buffer.cancel(future)
+    assert future.cancelled()
+    assert buffer.stats()['pending'] == 0
+    assert written == []
+
+
+def test_cancel_refuses_a_reading_being_written(app, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_ingest(readings):
+        started.set()
+        release.wait(5)
+        return [{'index': i, 'status': 'ok'} for i in range(len(readings))]
+
+    monkeypatch.setattr(write_buffer, 'ingest_readings', slow_ingest)
+    buffer = WriteBuffer(app, max_batch=1, max_wait=0)
+
+    future = buffer.submit({'device_id': '100', 'data': {'t': 1}})
+    assert started.wait(5)
+    assert not buffer.cancel(future)
+    release.set()
+    assert future.result(5)['status'] == 'ok'